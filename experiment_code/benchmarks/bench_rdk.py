@@ -0,0 +1,186 @@
+"""
+benchmark suite of the dot motion path (DotMotionEngine behind RDK_3_sets)
+
+sweeps dot density, aperture diameter, number of dot sets, noise dot behaviour, kernel and refresh rate, and measures
+initialization, the per-frame update (step) and the wrap + opacity part of it. Per-frame latencies are reported as
+p50/p95/p99/max together with the headroom of the p99 against the frame budget of each refresh rate.
+
+run from experiment_code:
+    python benchmarks/bench_rdk.py [--quick] [--output results.json] [--compare baseline.json]
+results are saved as JSON (benchmarks/results/rdk_<date>_<commit>.json by default) so runs on different commits can be
+compared with --compare
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rdk_engine import DotMotionEngine
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+FULL_GRID = dict(
+    dot_density=[1, 5, 20],
+    aperture_diameter=[8, 12, 16],
+    n_dot_sets=[1, 3, 5],
+    random_dot_behaviour=['walk', 'direction', 'position'],
+    kernel=['reference', 'inplace'],
+    frame_rate=[60, 120, 144, 240],
+)
+QUICK_GRID = dict(
+    dot_density=[1, 20],
+    aperture_diameter=[8],
+    n_dot_sets=[3],
+    random_dot_behaviour=['walk', 'position'],
+    kernel=['reference', 'inplace'],
+    frame_rate=[60, 240],
+)
+
+
+###################################
+# FUNCTIONS
+###################################
+def percentiles_us(durations_ns):
+    """
+    p50/p95/p99/max of a list of durations in ns, in microseconds
+    """
+    durations_us = np.array(durations_ns) / 1000
+    p50, p95, p99 = np.percentile(durations_us, [50, 95, 99])
+    return dict(p50_us=p50, p95_us=p95, p99_us=p99, max_us=durations_us.max())
+
+
+def wrap_and_opacity(engine, set_index):
+    """
+    run only the wrap + opacity part of a frame update on one set
+    """
+    if engine.kernel == 'inplace':
+        positions, x_positions, y_positions, opacities = engine._set_views[set_index]
+        engine._move.fill(0)
+        engine.wrap_and_opacity_inplace(positions, x_positions, y_positions, opacities)
+    else:
+        positions = engine.positions[set_index]
+        no_move = np.zeros(engine.n_dots)
+        engine.wrap_around_circular(positions, no_move, no_move)
+        engine.compute_dot_opacity(positions)
+
+
+def bench_config(config, duration=1.0, n_trials=10, seed=0):
+    """
+    benchmark one configuration over n_trials stimuli of the given duration
+    """
+    parameters = dict(
+        n_dot_sets=config['n_dot_sets'],
+        random_dot_behaviour=config['random_dot_behaviour'],
+        duration=duration,
+        aperture_diameter=config['aperture_diameter'],
+        fixation_diameter=0.4,
+        dot_diameter=0.16,
+        dot_density=config['dot_density'],
+        speed=2,
+        kernel=config['kernel'],
+    )
+    rng = np.random.default_rng(seed)
+    init_ns, step_ns, wrap_opacity_ns = [], [], []
+    for _ in range(n_trials):
+        start = time.perf_counter_ns()
+        engine = DotMotionEngine(config['frame_rate'], rng.uniform(0, 360), 0.5, parameters, rng)
+        init_ns.append(time.perf_counter_ns() - start)
+        for frame in range(engine.n_frames_for(duration)):
+            start = time.perf_counter_ns()
+            engine.step()
+            step_ns.append(time.perf_counter_ns() - start)
+            start = time.perf_counter_ns()
+            wrap_and_opacity(engine, frame % engine.n_dot_sets)
+            wrap_opacity_ns.append(time.perf_counter_ns() - start)
+
+    budget_us = 1e6 / config['frame_rate']
+    step = percentiles_us(step_ns)
+    return dict(
+        config,
+        n_dots=engine.n_dots,
+        init=percentiles_us(init_ns),
+        step=step,
+        wrap_opacity=percentiles_us(wrap_opacity_ns),
+        budget_us=budget_us,
+        headroom_us=budget_us - step['p99_us'],
+        headroom_percent=(budget_us - step['p99_us']) / budget_us * 100,
+    )
+
+
+def config_key(result):
+    return tuple(result[name] for name in FULL_GRID)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def compare(results, baseline_path, threshold=1.1):
+    """
+    print configurations whose p99 step latency got more than threshold times slower than in the baseline file
+    """
+    with open(baseline_path) as f:
+        baseline = {config_key(result): result for result in json.load(f)['results']}
+    regressions = 0
+    for result in results:
+        old = baseline.get(config_key(result))
+        if old is None:
+            continue
+        ratio = result['step']['p99_us'] / old['step']['p99_us']
+        if ratio > threshold:
+            regressions += 1
+            print(f"REGRESSION {config_key(result)}: p99 {old['step']['p99_us']:.1f} -> {result['step']['p99_us']:.1f} us "
+                  f"({ratio:.2f}x)")
+    print(f'{regressions} regressions (>{threshold:.2f}x p99) against {baseline_path}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the RDK dot engine')
+    parser.add_argument('--quick', action='store_true', help='small grid')
+    parser.add_argument('--trials', type=int, default=10, help='stimuli (of 1 s) per configuration')
+    parser.add_argument('--output', default=None, help='result JSON path')
+    parser.add_argument('--compare', default=None, help='baseline result JSON to compare against')
+    args = parser.parse_args()
+
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    results = []
+    print(f"{'density':>7}{'aperture':>9}{'sets':>5} {'noise':<10}{'kernel':<10}{'Hz':>4}{'n_dots':>7}"
+          f"{'init us':>9}{'p50 us':>8}{'p99 us':>8}{'max us':>8}{'w+o p99':>9}{'headroom':>9}")
+    for values in itertools.product(*grid.values()):
+        config = dict(zip(grid.keys(), values))
+        result = bench_config(config, n_trials=args.trials)
+        results.append(result)
+        print(f"{config['dot_density']:>7}{config['aperture_diameter']:>9}{config['n_dot_sets']:>5} "
+              f"{config['random_dot_behaviour']:<10}{config['kernel']:<10}{config['frame_rate']:>4}{result['n_dots']:>7}"
+              f"{result['init']['p50_us']:>9.0f}{result['step']['p50_us']:>8.1f}{result['step']['p99_us']:>8.1f}"
+              f"{result['step']['max_us']:>8.1f}{result['wrap_opacity']['p99_us']:>9.1f}"
+              f"{result['headroom_percent']:>8.1f}%")
+
+    commit = git_commit()
+    output = args.output
+    if output is None:
+        if not os.path.exists(RESULTS_DIR):
+            os.mkdir(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, f"rdk_{time.strftime('%Y-%m-%d_%Hh%M')}_{commit}.json")
+    with open(output, 'w') as f:
+        json.dump(dict(commit=commit, date=time.strftime('%Y-%m-%d %H:%M:%S'), python=platform.python_version(),
+                       numpy=np.__version__, machine=platform.platform(), grid=grid, results=results), f, indent=1)
+    print(f'results saved to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
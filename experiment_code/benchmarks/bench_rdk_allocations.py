@@ -0,0 +1,76 @@
+"""
+allocations per frame of the DotMotionEngine kernels
+
+run from experiment_code: python benchmarks/bench_rdk_allocations.py
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rdk_engine import DotMotionEngine
+
+
+###################################
+# FUNCTIONS
+###################################
+def measure(parameters, n_frames=600, frame_rate=144):
+    """
+    Return the mean transient bytes allocated per frame (tracemalloc peak above the steady state) and the mean frame
+    update time in microseconds. An allocation-free kernel allocates a small constant amount (Python scalars and views),
+    independent of the number of dots.
+    """
+    engine = DotMotionEngine(frame_rate, 45, 0.5, parameters, np.random.default_rng(0))
+    for _ in range(3 * engine.n_dot_sets):  # warm up
+        engine.step()
+
+    tracemalloc.start()
+    transient_bytes = []
+    for _ in range(n_frames):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        engine.step()
+        _, peak = tracemalloc.get_traced_memory()
+        transient_bytes.append(peak - current)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(n_frames):
+        engine.step()
+    frame_us = (time.perf_counter() - start) / n_frames * 1e6
+    return engine.n_dots, np.mean(transient_bytes), frame_us
+
+
+if __name__ == '__main__':
+    results = {}
+    print(f"{'behaviour':<16}{'kernel':<10}{'dtype':<9}{'n_dots':>7}{'bytes/frame':>13}{'us/frame':>10}")
+    for random_dot_behaviour in ['walk', 'direction', 'position']:
+        for dot_density in [1, 10, 50]:
+            for kernel, dtype in [('reference', 'float64'), ('inplace', 'float64'), ('inplace', 'float32')]:
+                parameters = {
+                    'n_dot_sets': 3,
+                    'random_dot_behaviour': random_dot_behaviour,
+                    'dot_life': 20,
+                    'aperture_diameter': 8,
+                    'fixation_diameter': 0.4,
+                    'dot_density': dot_density,
+                    'speed': 2,
+                    'kernel': kernel,
+                    'dtype': dtype
+                }
+                n_dots, bytes_per_frame, frame_us = measure(parameters)
+                results.setdefault((random_dot_behaviour, kernel, dtype), []).append((n_dots, bytes_per_frame))
+                print(f"{random_dot_behaviour:<16}{kernel:<10}{dtype:<9}{n_dots:>7}{bytes_per_frame:>13.0f}{frame_us:>10.1f}")
+
+    # Bytes that scale with the number of dots are array buffers; the constant rest is Python objects (views, scalars)
+    print('\nper-frame array allocation (slope of bytes/frame over n_dots)')
+    for (random_dot_behaviour, kernel, dtype), points in results.items():
+        n_dots, bytes_per_frame = np.array(points).T
+        slope = np.polyfit(n_dots, bytes_per_frame, 1)[0]
+        print(f"{random_dot_behaviour:<16}{kernel:<10}{dtype:<9}{slope:>8.1f} bytes/dot/frame")
@@ -0,0 +1,86 @@
+"""
+per-trial setup time of the reference display: building two arcs and a line every trial (as before) against rotating
+the persistent hf.ReferenceDisplay, each followed by the first draw + flip of the reference screen
+
+run from experiment_code: python benchmarks/bench_reference_display.py [--trials 200] [--mock]
+(--mock, automatic if psychopy is not installed, runs on the headless mock backend, which only measures the Python
+side; stimulus construction on a real GL window costs considerably more)
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import argparse
+import importlib.util
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+###################################
+# FUNCTIONS
+###################################
+def build_per_trial(win, hf, visual, radius, reference):
+    """
+    the reference display as it was built in every trial
+    """
+    arc_CW = hf.draw_arc(win, radius, reference, reference - 90, 'blue')
+    arc_CCW = hf.draw_arc(win, radius, reference, reference + 90, 'orange')
+    ref_line = visual.Line(win, start=((radius - 1) * np.cos(np.deg2rad(reference)), (radius - 1) * np.sin(np.deg2rad(reference))),
+                           end=((radius + 1) * np.cos(np.deg2rad(reference)), (radius + 1) * np.sin(np.deg2rad(reference))),
+                           lineColor='white', lineWidth=6)
+    return [arc_CW, arc_CCW, ref_line]
+
+
+def time_setup(win, setup, references):
+    """
+    setup and first frame times (ms) per trial, setup(reference) returns the stimuli to draw
+    """
+    setup_ms, first_frame_ms = [], []
+    for reference in references:
+        start = time.perf_counter()
+        stimuli = setup(reference)
+        built = time.perf_counter()
+        for stimulus in stimuli:
+            stimulus.draw()
+        win.flip()
+        setup_ms.append((built - start) * 1000)
+        first_frame_ms.append((time.perf_counter() - built) * 1000)
+    return np.array(setup_ms), np.array(first_frame_ms)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='reference display setup time')
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--mock', action='store_true', help='use the headless mock psychopy backend')
+    args = parser.parse_args()
+
+    if args.mock or importlib.util.find_spec('psychopy') is None:
+        import mock_psychopy
+        mock_psychopy.install(refresh_rate=1000)  # short simulated frames, the flip wait is not what is measured
+        print('using the mock psychopy backend')
+    from psychopy import visual
+    import helper_functions as hf
+
+    win = hf.create_window()
+    radius = 4
+    references = np.random.default_rng(0).uniform(0, 360, args.trials)
+    reference_display = hf.ReferenceDisplay(win, radius)
+
+    def rotate(reference):
+        reference_display.set_reference(reference)
+        return reference_display.stimuli
+
+    print(f"{'reference display':<22}{'setup p50 ms':>14}{'setup p99 ms':>14}{'first frame p50 ms':>20}")
+    results = {}
+    for name, setup in [('built every trial', lambda reference: build_per_trial(win, hf, visual, radius, reference)),
+                        ('persistent, rotated', rotate)]:
+        setup_ms, first_frame_ms = time_setup(win, setup, references)
+        results[name] = setup_ms
+        print(f'{name:<22}{np.median(setup_ms):>14.3f}{np.percentile(setup_ms, 99):>14.3f}{np.median(first_frame_ms):>20.3f}')
+    saved = np.median(results['built every trial']) - np.median(results['persistent, rotated'])
+    print(f'saved per trial: {saved:.3f} ms (median setup)')
+    win.close()
@@ -0,0 +1,74 @@
+"""
+coherent dot selection strategies of the DotMotionEngine against the original np.random.choice + np.setdiff1d sampler
+
+run from experiment_code: python benchmarks/bench_signal_selection.py
+(first checks that every strategy keeps exactly n_coherent signal dots up to coherence 1, in both engine kernels)
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rdk_engine import SIGNAL_DOT_SELECTIONS, DotMotionEngine
+
+
+###################################
+# FUNCTIONS
+###################################
+def time_per_call(function, n_calls):
+    """
+    mean time per call in microseconds
+    """
+    function()  # warm up
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        function()
+    return (time.perf_counter() - start) / n_calls * 1e6
+
+
+def legacy_sampler(rng, n_dots, n_coherent):
+    """
+    the sampler of the original update_dots closure
+    """
+    def sample():
+        coherent_indices = rng.choice(n_dots, n_coherent, replace=False)
+        random_indices = np.setdiff1d(np.arange(n_dots), coherent_indices)
+        return coherent_indices, random_indices
+    return sample
+
+
+def check_selections(coherences=(0.0, 0.5, 0.9, 1.0), n_frames=300):
+    """
+    run every strategy in both kernels of the engine and assert that each frame has exactly n_coherent signal dots
+    """
+    parameters = dict(aperture_diameter=8, dot_density=1, signal_lifetime=5)
+    for name in SIGNAL_DOT_SELECTIONS:
+        for kernel in ['reference', 'inplace']:
+            for coherence in coherences:
+                engine = DotMotionEngine(60, 90, coherence, dict(parameters, signal_dots=name, kernel=kernel),
+                                         np.random.default_rng(0))
+                for frame in range(n_frames):
+                    engine.step()
+                    n_signal = engine.selection.masks.sum(axis=1)
+                    assert np.all(n_signal == engine.n_coherent), (name, kernel, coherence, frame, n_signal)
+    print(f'signal dot selection check passed (coherence {", ".join(map(str, coherences))})')
+
+
+if __name__ == '__main__':
+    check_selections()
+    n_calls = 2000
+    coherence = 0.5
+    print(f"{'n_dots':>7}{'legacy':>10}" + ''.join(f"{name:>12}" for name in SIGNAL_DOT_SELECTIONS) + '   (us per frame)')
+    for n_dots in [50, 500, 2500, 10000]:
+        n_coherent = int(n_dots * coherence)
+        rng = np.random.default_rng(0)
+        timings = [time_per_call(legacy_sampler(rng, n_dots, n_coherent), n_calls)]
+        for selection_class in SIGNAL_DOT_SELECTIONS.values():
+            selection = selection_class(1, n_dots, n_coherent, rng, {})
+            timings.append(time_per_call(lambda: selection.select(0), n_calls))
+        print(f"{n_dots:>7}" + ''.join(f"{timing:>10.1f}" if i == 0 else f"{timing:>12.1f}" for i, timing in enumerate(timings)))
@@ -0,0 +1,139 @@
+"""
+startup time of the experiment entry points: interpreter + imports, and until the window is ready
+
+each entry point is imported in a fresh interpreter (so nothing is cached between runs), then a window is created with
+hf.create_window() and flipped once. Importing must not open windows; a module that does is reported as not
+import-safe. With --mock (automatic if psychopy is not installed) the headless mock backend replaces psychopy, which
+measures everything except psychopy's own import and window creation.
+
+run from experiment_code:
+    python benchmarks/bench_startup.py [--runs 5] [--mock] [--compare baseline.json]
+results are saved as JSON (benchmarks/results/startup_<date>_<commit>.json by default); --compare fails (exit code 1)
+if an entry point got more than 25% slower than in the baseline
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+from bench_rdk import RESULTS_DIR, git_commit
+
+EXPERIMENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ['main', 'training', 'staircase', 'session', 'RDK_3_sets']
+
+# runs in the fresh interpreter, prints one JSON line
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {experiment_dir!r})
+if {mock}:
+    import mock_psychopy
+    mock_psychopy.install()
+import {module}
+imported = time.perf_counter()
+if {mock}:
+    windows_at_import = len(mock_psychopy.backend.windows)
+else:
+    from psychopy.visual import window
+    windows_at_import = len(getattr(window, 'openWindows', []))
+import helper_functions as hf
+win = hf.create_window()
+win.flip()
+window_ready = time.perf_counter()
+win.close()
+print(json.dumps(dict(import_s=imported - start, window_s=window_ready - imported, windows_at_import=windows_at_import)))
+'''
+
+
+###################################
+# FUNCTIONS
+###################################
+def time_startup(module, mock):
+    """
+    start a fresh interpreter that imports module and opens a window, return its timings in ms
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD.format(experiment_dir=EXPERIMENT_DIR, mock=mock, module=module)],
+                            capture_output=True, text=True, cwd=EXPERIMENT_DIR)
+    total_s = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'{module}: {result.stderr.strip()}')
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return dict(total_ms=total_s * 1000, import_ms=timings['import_s'] * 1000, window_ms=timings['window_s'] * 1000,
+                windows_at_import=timings['windows_at_import'])
+
+
+def bench_entry_point(module, mock, n_runs):
+    runs = [time_startup(module, mock) for _ in range(n_runs)]
+    return dict(
+        module=module,
+        total_ms=float(np.median([run['total_ms'] for run in runs])),
+        import_ms=float(np.median([run['import_ms'] for run in runs])),
+        window_ms=float(np.median([run['window_ms'] for run in runs])),
+        import_safe=all(run['windows_at_import'] == 0 for run in runs),
+    )
+
+
+def compare(results, baseline_path, threshold=1.25):
+    """
+    print entry points whose median startup (interpreter start until window ready) got more than threshold times
+    slower than in the baseline file, return their number
+    """
+    with open(baseline_path) as f:
+        baseline = {result['module']: result for result in json.load(f)['results']}
+    regressions = 0
+    for result in results:
+        old = baseline.get(result['module'])
+        if old is None:
+            continue
+        ratio = result['total_ms'] / old['total_ms']
+        if ratio > threshold:
+            regressions += 1
+            print(f"REGRESSION {result['module']}: {old['total_ms']:.0f} -> {result['total_ms']:.0f} ms ({ratio:.2f}x)")
+    print(f'{regressions} regressions (>{threshold:.2f}x) against {baseline_path}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='startup time of the experiment entry points')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per entry point (median is reported)')
+    parser.add_argument('--mock', action='store_true', help='use the headless mock psychopy backend')
+    parser.add_argument('--output', default=None, help='result JSON path')
+    parser.add_argument('--compare', default=None, help='baseline result JSON to compare against')
+    args = parser.parse_args()
+
+    mock = args.mock or importlib.util.find_spec('psychopy') is None
+    if mock and not args.mock:
+        print('psychopy is not installed, using the mock backend')
+
+    results = []
+    print(f"{'entry point':<14}{'total ms':>10}{'import ms':>11}{'window ms':>11}  import-safe")
+    for module in ENTRY_POINTS:
+        result = bench_entry_point(module, mock, args.runs)
+        results.append(result)
+        print(f"{module:<14}{result['total_ms']:>10.0f}{result['import_ms']:>11.0f}{result['window_ms']:>11.0f}  "
+              f"{'yes' if result['import_safe'] else 'NO (opens a window at import)'}")
+
+    commit = git_commit()
+    output = args.output
+    if output is None:
+        if not os.path.exists(RESULTS_DIR):
+            os.mkdir(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, f"startup_{time.strftime('%Y-%m-%d_%Hh%M')}_{commit}.json")
+    with open(output, 'w') as f:
+        json.dump(dict(commit=commit, date=time.strftime('%Y-%m-%d %H:%M:%S'), mock=mock, python=sys.version.split()[0],
+                       results=results), f, indent=1)
+    print(f'results saved to {output}')
+
+    failed = not all(result['import_safe'] for result in results)
+    if args.compare:
+        failed = compare(results, args.compare) > 0 or failed
+    sys.exit(1 if failed else 0)
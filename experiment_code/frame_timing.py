@@ -0,0 +1,68 @@
+"""
+frame timing of the dot display loop: frame counts of durations, per-trial flip statistics and a per-session frame
+interval histogram
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import numpy as np
+
+
+###################################
+# FUNCTIONS
+###################################
+def frames_for_duration(duration, frame_rate):
+    """
+    Number of frames that comes closest to duration at frame_rate (at least one frame).
+    Every phase of a trial is shown for this many flips, so its duration is a whole number of refresh periods.
+    """
+    return max(1, int(round(duration * frame_rate)))
+
+
+def flip_stats(flip_times, frame_rate, drop_threshold=1.5):
+    """
+    Statistics of one stimulus presentation from its flip timestamps (seconds, one per frame, as returned by win.flip()).
+    An interval longer than drop_threshold frame durations counts as round(interval / frame duration) - 1 dropped frames.
+    The actual duration runs from the first flip to the expected end of the last frame.
+    """
+    frame_duration = 1.0 / frame_rate
+    intervals = np.diff(flip_times)
+    late = intervals > drop_threshold * frame_duration
+    dropped_frames = int(np.sum(np.round(intervals[late] / frame_duration) - 1))
+    return dict(
+        dropped_frames=dropped_frames,
+        max_frame_interval=float(intervals.max()) if len(intervals) else None,
+        motion_duration=float(flip_times[-1] - flip_times[0] + frame_duration) if len(flip_times) else None,
+    )
+
+
+###################################
+# CLASSES
+###################################
+class FrameIntervalHistogram:
+    """
+    Histogram of all frame intervals of a session in bins of bin_ms milliseconds up to max_ms
+    (longer intervals go in the last bin).
+    """
+
+    def __init__(self, bin_ms=0.5, max_ms=100):
+        self.bin_edges_ms = np.arange(0, max_ms + bin_ms, bin_ms)
+        self.counts = np.zeros(len(self.bin_edges_ms) - 1, dtype=int)
+
+    def add(self, flip_times):
+        """
+        add the intervals between consecutive flip timestamps (seconds)
+        """
+        intervals_ms = np.clip(np.diff(flip_times) * 1000, 0, self.bin_edges_ms[-1] - 1e-9)
+        self.counts += np.histogram(intervals_ms, bins=self.bin_edges_ms)[0]
+
+    def write_csv(self, path):
+        """
+        write the non-empty bins as bin_start_ms,bin_end_ms,count
+        """
+        with open(path, 'w') as f:
+            f.write('bin_start_ms,bin_end_ms,count\n')
+            for start, end, count in zip(self.bin_edges_ms[:-1], self.bin_edges_ms[1:], self.counts):
+                if count:
+                    f.write(f'{start:g},{end:g},{count}\n')
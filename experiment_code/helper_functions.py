@@ -7,10 +7,11 @@ Maja Friedemann 2024
 ###################################
 # IMPORT PACKAGES
 ###################################
+import ctypes  # for hiding the mouse cursor on Windows
+import os
 import random
 import time
-from psychopy import gui, visual, core, data, event
-import pandas as pd
+from psychopy import visual, core, event, monitors
 import numpy as np
 
 
@@ -29,9 +30,294 @@ class EEGConfig:
             print('would send trigger: ' + str(code))
 
 
+class DrawStats:
+    """
+    number of frames, draw calls per frame and drawing time per frame of every scene name
+    """
+
+    def __init__(self):
+        self.scenes = {}  # name -> [frames, draw calls, total ns, max ns]
+
+    def add(self, name, n_draw_calls, draw_ns):
+        scene = self.scenes.get(name)
+        if scene is None:
+            scene = self.scenes[name] = [0, 0, 0, 0]
+        scene[0] += 1
+        scene[1] += n_draw_calls
+        scene[2] += draw_ns
+        scene[3] = max(scene[3], draw_ns)
+
+    def report(self):
+        return [dict(scene=name, frames=frames, draw_calls_per_frame=draw_calls / frames,
+                     mean_draw_ms=total_ns / frames / 1e6, max_draw_ms=max_ns / 1e6)
+                for name, (frames, draw_calls, total_ns, max_ns) in self.scenes.items()]
+
+    def print_report(self):
+        print(f"{'scene':<16}{'frames':>8}{'draws/frame':>13}{'mean ms':>9}{'max ms':>9}")
+        for row in self.report():
+            print(f"{row['scene']:<16}{row['frames']:>8}{row['draw_calls_per_frame']:>13.1f}"
+                  f"{row['mean_draw_ms']:>9.3f}{row['max_draw_ms']:>9.3f}")
+
+
+draw_stats = DrawStats()  # shared by all scenes that are not given their own DrawStats
+
+
+class Scene:
+    """
+    Draw list compiled once per phase: nested lists of stimuli are flattened and the stimuli's draw methods bound at
+    construction, so drawing a frame is a single loop over the bound methods. Quit keys are not checked here
+    (see check_quit). Draw calls and drawing time of every frame are recorded in a DrawStats under the scene's name.
+    """
+
+    def __init__(self, stimuli, name='scene', stats=None):
+        self.name = name
+        self.stimuli = [stim for sublist in stimuli for stim in (sublist if isinstance(sublist, list) else [sublist])]
+        self.draw_calls = [stimulus.draw for stimulus in self.stimuli]
+        self.stats = stats
+        # profiler phase of each draw call, '<scene>/draw_<stimulus class>' (numbered if a class is drawn twice)
+        class_names = [type(stimulus).__name__ for stimulus in self.stimuli]
+        self.lap_names = []
+        for i, class_name in enumerate(class_names):
+            n = class_names[:i].count(class_name)
+            self.lap_names.append(f'{name}/draw_{class_name}' + (f'_{n + 1}' if n else ''))
+
+    def draw(self):
+        start_ns = time.perf_counter_ns()
+        for draw in self.draw_calls:
+            draw()
+        (self.stats or draw_stats).add(self.name, len(self.draw_calls), time.perf_counter_ns() - start_ns)
+
+    def draw_profiled(self, profiler):
+        """
+        draw with every draw call timed as its own frame phase of an enabled profiler, return the end time
+        """
+        start_ns = t = profiler.now()
+        for draw, lap_name in zip(self.draw_calls, self.lap_names):
+            draw()
+            t = profiler.lap(lap_name, t)
+        (self.stats or draw_stats).add(self.name, len(self.draw_calls), t - start_ns)
+        return t
+
+    def show(self, win):
+        """
+        draw and flip, return the flip time
+        """
+        self.draw()
+        return win.flip()
+
+
+class ReferenceDisplay:
+    """
+    Reference direction display: a blue arc on the CW side and an orange arc on the CCW side of the reference, and a
+    white line across the aperture edge at the reference direction. The stimuli are built once, pointing at 0 degrees,
+    and rotated to each trial's reference with ori, so no new stimuli are created before the response window.
+    """
+
+    def __init__(self, win, radius, line_width=6):
+        self.arc_CW = draw_arc(win, radius, 0, -90, 'blue')
+        self.arc_CCW = draw_arc(win, radius, 0, 90, 'orange')
+        self.ref_line = visual.Line(win, start=(radius - 1, 0), end=(radius + 1, 0), lineColor='white', lineWidth=line_width)
+        self.stimuli = [self.arc_CW, self.arc_CCW, self.ref_line]
+
+    def set_reference(self, reference):
+        """
+        point the display at reference (degrees, counterclockwise from the right like the motion direction;
+        psychopy's ori turns clockwise)
+        """
+        for stimulus in self.stimuli:
+            stimulus.ori = -reference
+
+
+class ConfidenceSlider:
+    """
+    Confidence rating screen, built once per session: the slider, the marker, the question and one pre-rendered
+    rating label per slider position ("50%" to "100%"). Rating only moves the marker and swaps which label is drawn,
+    so no text is re-rasterised while the screen is shown.
+    """
+    labels = ["50%", "60%", "70%", "80%", "90%", "100%"]
+
+    def __init__(self, win, response_keys):
+        self.win = win
+        self.response_keys = response_keys
+        self.slider = visual.Slider(win,
+                                    ticks=[0, 1, 2, 3, 4, 5],
+                                    labels=["50%", "", "", "", "", "100%"],
+                                    pos=(0, 0),
+                                    size=(15, 2), units="deg", flip=True, style='slider', granularity=1, labelHeight=0.7)
+        self.slider.tickLines.sizes = (0.1, 2)
+        self.marker = visual.ShapeStim(
+            win=win,
+            vertices=((-0.2, -1), (0.2, -1), (0.2, 1), (-0.2, 1)),
+            lineWidth=2,
+            pos=(self.marker_x(0), self.slider.pos[1]),
+            closeShape=True,
+            fillColor='green',
+            lineColor='green'
+        )
+        # the rating label under each slider position
+        self.rating_txts = [visual.TextStim(win=win, text=label, height=0.6,
+                                            pos=(self.marker_x(position), self.slider.pos[1] - 1.65), color='white')
+                            for position, label in enumerate(self.labels)]
+        self.question_txt = visual.TextStim(
+            win,
+            text=f'How confident are you?',
+            height=1,
+            pos=(0, 5),
+            color='white',
+            bold=True,
+            font='Arial',
+            alignText='center',
+            wrapWidth=30
+        )
+        # one draw list per marker position, with that position's rating label
+        self.scenes = [Scene([self.slider, rating_txt, self.question_txt, self.marker], 'confidence')
+                       for rating_txt in self.rating_txts]
+
+    def marker_x(self, position):
+        """
+        horizontal position of the marker at a slider position
+        """
+        return position * (self.slider.size[0] / 5) - (self.slider.size[0] / 2)
+
+    def set_position(self, position):
+        self.slider.markerPos = position
+        self.marker.pos = (self.marker_x(position), self.slider.pos[1])
+
+    def scene(self):
+        return self.scenes[int(self.slider.markerPos)]
+
+    def rate(self, rng=None):
+        """
+        Confidence rating with response time
+        (rng: numpy random Generator for the initial slider position, the random module is used if None)
+        """
+        if rng is None:
+            initial_pos = random.choice(self.slider.ticks)  # generate a random initial position for the slider marker
+        else:
+            initial_pos = int(rng.choice(self.slider.ticks))
+        self.set_position(initial_pos)  # set the slider marker to the initial random position
+        self.marker.lineColor = 'green'
+        self.marker.fillColor = 'green'
+
+        # the response key read through the hardware keyboard is still in the event buffer, it must not move the marker
+        event.clearEvents('keyboard')
+        start_time = time.time()  # Record the start time
+
+        while True:
+            keys = event.getKeys()
+            if 'q' in keys:
+                self.win.close()
+                core.quit()
+            if self.response_keys[0] in keys:
+                self.set_position(max(self.slider.markerPos - 1, 0))
+            elif self.response_keys[1] in keys:
+                self.set_position(min(self.slider.markerPos + 1, 5))
+            elif 'space' in keys:
+                break
+            self.scene().show(self.win)  # one frame per loop, paced by the flip
+
+        end_time = time.time()  # Record the end time
+        response_time = end_time - start_time  # Calculate the response time
+
+        rating = 50 + self.slider.markerPos * 10  # convert the marker position to the percentage rating
+        self.marker.lineColor = 'black'
+        self.marker.fillColor = 'black'
+        draw_all_stimuli(self.win, self.scene(), 0.5)
+
+        return rating, response_time  # Return both the rating and the response time
+
+
 ###################################
 # FUNCTIONS
 ###################################
+def get_participant_info(exp_name):
+    """
+    participant info pop-up, quits if it is cancelled
+    """
+    from psychopy import gui  # imported here, loading the GUI toolkit is slow and only the pop-up needs it
+    expInfo = {'participant nr': '999',
+               'eeg (y/n)': 'n',
+               'session nr': '1',
+               'age': '',
+               'gender (f/m/o)': '',
+               }
+    dlg = gui.DlgFromDict(dictionary=expInfo, sortKeys=False,
+                          title=exp_name)
+    if not dlg.OK:
+        core.quit()
+    return expInfo
+
+
+def get_date_str():
+    """
+    date and time for the data file names, in the format of psychopy's data.getDateStr()
+    (psychopy.data is not imported for it, it is slow to import)
+    """
+    now = time.time()
+    return time.strftime('%Y-%m-%d_%Hh%M.%S', time.localtime(now)) + f'.{int(now * 1000) % 1000:03d}'
+
+
+def create_window():
+    """
+    fullscreen window on the experiment monitor, with the mouse cursor hidden
+    one window is shared by training, staircase and main task when they run in one session (session.py)
+    """
+    mon = monitors.Monitor('maja_dell_1')
+    win = visual.Window(
+        size=(1920, 1080),
+        units="deg",
+        screen=1,
+        fullscr=True,
+        color=(0.001, 0.001, 0.001),
+        colorSpace='rgb',
+        monitor=mon
+    )
+
+    # MOUSE
+    win.setMouseVisible(False)
+    mouse = event.Mouse(visible=False, win=win)
+    mouse.setVisible(False)
+    # Explicitly hide the cursor on Windows
+    if os.name == 'nt':  # Check if the OS is Windows
+        ctypes.windll.user32.ShowCursor(False)
+    return win
+
+
+def create_text_stimuli(win):
+    """
+    welcome and instruction texts of training, staircase and main task
+    """
+    return dict(
+        big_txt=visual.TextStim(win=win, text='Welcome!', height=2, pos=[0, 3], color='white', wrapWidth=20, font='Monospace'),
+        instructions_txt=visual.TextStim(win=win, text="\n\n\n\n\n\n Press SPACE to start.", height=1, pos=[0, 2], wrapWidth=30, color='white', font='Monospace'),
+        instructions_top_txt=visual.TextStim(win=win, text="Instructions", height=1, pos=[0, 7.5], wrapWidth=30, color='white', font='Monospace'),
+    )
+
+
+def create_dot_field_stimuli(win, dot_params):
+    """
+    fixation cross, no-dot zone, dot field outline and reference display of the training and staircase trials
+    """
+    return dict(
+        fixation=visual.TextStim(win, text='+', height=1.5, color='white'),
+        no_dot_zone=visual.Circle(win, radius=0.5, edges=100, fillColor=(0.001, 0.001, 0.001)),  # circle around fixation cross
+        dot_outline=visual.Circle(win, radius=dot_params['fieldSize'][0] / 2, edges=100, lineColor='white', lineWidth=5, fillColor=None),
+        reference_display=ReferenceDisplay(win, dot_params['fieldSize'][0] / 2, line_width=10),
+    )
+
+
+def create_dot_motion_stimulus(win, dot_params, direction, coherence):
+    """
+    psychopy DotStim for the training and staircase trials
+
+    Parameters:
+    - dot_params: DotStim keyword arguments (units, nDots, dotSize, speed, fieldSize, fieldShape, dotLife, signalDots, noiseDots)
+    - direction: direction of the coherent motion in degrees
+    - coherence: proportion of signal dots (0.0 to 1.0)
+    """
+    return visual.DotStim(win, dir=direction, coherence=coherence, **dot_params)
+
+
 def exit_q(win, key_list=None):
     """
     allow exiting the experiment by pressing q when we are in full screen mode
@@ -49,14 +335,23 @@ def exit_q(win, key_list=None):
     return res
 
 
+def check_quit(win, quit_keys=('q',)):
+    """
+    close the window and quit if a quit key was pressed
+    only the quit keys are read, other keys (responses) stay in the buffer, so this can run on every frame
+    """
+    if event.getKeys(keyList=list(quit_keys)):
+        win.close()
+        core.quit()
+
+
 def draw_all_stimuli(win, stimuli, wait=0.01):
     """
-    draw all stimuli, flip window, wait (default wait time is 0.01)
+    draw all stimuli (a Scene, or a possibly nested list of stimuli), flip window, wait (default wait time is 0.01)
+    for stimuli that are shown on many frames, compile a Scene once and call its show() in the frame loop
     """
-    flattened_stimuli = [stim for sublist in stimuli for stim in (sublist if isinstance(sublist, list) else [sublist])]  # flatten the list of stimuli to accommodate nested lists
-    for stimulus in flattened_stimuli:
-        stimulus.draw()
-    win.flip(), exit_q(win), core.wait(wait)
+    scene = stimuli if isinstance(stimuli, Scene) else Scene(stimuli, 'draw_all_stimuli')
+    scene.show(win), exit_q(win), core.wait(wait)
 
 
 def check_button(win, buttons, stimuli, mouse):
@@ -64,7 +359,8 @@ def check_button(win, buttons, stimuli, mouse):
     Check for button hover and click for multiple buttons.
     Return the button object that was clicked and the response time.
     """
-    draw_all_stimuli(win, stimuli, 0.2)
+    scene = Scene(stimuli, 'buttons')
+    draw_all_stimuli(win, scene, 0.2)
     response_timer = core.Clock()  # Start the response timer
     button_glows = [visual.Rect(win, width=button.width+15, height=button.height+15, pos=button.pos, fillColor=button.fillColor, opacity=0.5) for button in buttons]
 
@@ -77,7 +373,7 @@ def check_button(win, buttons, stimuli, mouse):
                 core.wait(0.5)  # add delay to provide feedback of a click
                 return button, response_time  # return the button that was clicked and the response time
 
-        draw_all_stimuli(win, stimuli)  # redraw stimuli and check again
+        draw_all_stimuli(win, scene)  # redraw stimuli and check again
 
 
 def check_mouse_click(win, mouse):
@@ -119,65 +415,9 @@ def draw_arc(win, radius, start_deg, end_deg, color, pos=(0, 0)):
     return visual.ShapeStim(win, vertices=vertices, closeShape=False, lineColor=color, pos=pos, lineWidth=6)
 
 
-def get_confidence_rating(win, gv):
-    """
-    Confidence rating with response time
-    """
-    slider = visual.Slider(win,
-                           ticks=[0, 1, 2, 3, 4, 5],
-                           labels=["50%", "", "", "", "", "100%"],
-                           pos=(0, 0),
-                           size=(15, 2), units="deg", flip=True, style='slider', granularity=1, labelHeight=0.7)
-    slider.tickLines.sizes = (0.1, 2)
-    initial_pos = random.choice(slider.ticks)  # generate a random initial position for the slider marker
-    slider.markerPos = initial_pos  # set the slider marker to the initial random position
-    slider_marker = visual.ShapeStim(
-        win=win,
-        vertices=((-0.2, -1), (0.2, -1), (0.2, 1), (-0.2, 1)),
-        lineWidth=2,
-        pos=(slider.markerPos * (slider.size[0] / 5) - (slider.size[0] / 2), slider.pos[1]),
-        closeShape=True,
-        fillColor='green',
-        lineColor='green'
-    )
-    slider_labels = ["50%", "60%", "70%", "80%", "90%", "100%"]
-    slider_rating_txt = visual.TextStim(win=win, text=slider_labels[initial_pos], height=0.6,
-                                        pos=(slider_marker.pos[0], -1.65), color='white')
-    slider_question_text = visual.TextStim(
-        win,
-        text=f'How confident are you?',
-        height=1,
-        pos=(0, 5),
-        color='white',
-        bold=True,
-        font='Arial',
-        alignText='center',
-        wrapWidth=30
-    )
-
-    start_time = time.time()  # Record the start time
-
-    while True:
-        keys = event.getKeys()
-        if gv['response_keys'][0] in keys:
-            slider.markerPos = max(slider.markerPos - 1, 0)
-        elif gv['response_keys'][1] in keys:
-            slider.markerPos = min(slider.markerPos + 1, 5)
-        elif 'space' in keys:
-            break
-        slider_marker.pos = (slider.markerPos * (slider.size[0] / 5) - (slider.size[0] / 2), slider.pos[1])
-        slider_rating_txt.pos = (slider_marker.pos[0], slider.pos[1] - 1.65)
-        slider_rating_txt.text = slider_labels[int(slider.markerPos)]
-        stimuli = [slider, slider_rating_txt, slider_question_text, slider_marker]
-        draw_all_stimuli(win, stimuli)
-
-    end_time = time.time()  # Record the end time
-    response_time = end_time - start_time  # Calculate the response time
-
-    rating = 50 + slider.markerPos * 10  # convert the marker position to the percentage rating
-    slider_marker.lineColor = 'black'
-    slider_marker.fillColor = 'black'
-    draw_all_stimuli(win, stimuli, 0.5)
-
-    return rating, response_time  # Return both the rating and the response time
-
+def get_confidence_rating(win, gv, rng=None):
+    """
+    Confidence rating with response time, on a slider built for this call
+    (use a ConfidenceSlider to build it once per session)
+    """
+    return ConfidenceSlider(win, gv['response_keys']).rate(rng)
@@ -0,0 +1,239 @@
+"""
+incremental ingest of all trial data files into one indexed SQLite store
+
+every run of main.py, training.py and staircase.py leaves one file named participant_session_date in data/,
+data_training/ or data_staircase/ (.trials, or .csv from older runs). ingest() keeps trial_store.sqlite in sync
+with these files: a file whose size and mtime are unchanged is skipped without being read, a file whose content hash
+is unchanged only gets its mtime updated, and only new or changed files are parsed. Files that were deleted are
+removed from the store. Abandoned runs stay in the store with their n_trials, so they can be filtered out.
+
+tables:
+    sessions: one row per data file (session_id, path, phase, participant, session_nr, date, ..., n_trials)
+    trials: one row per trial, indexed by participant, session_nr, phase and trial_count
+
+usage:
+    python ingest.py  # update the store
+    python ingest.py --query "SELECT participant, AVG(response = reference_direction) FROM trials GROUP BY 1"
+    df = query('SELECT * FROM trials WHERE phase = ?', ['main'])  # from analysis code
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import argparse
+import csv
+import hashlib
+import os
+import re
+import sqlite3
+import numpy as np
+
+from trial_table import MISSING_INT, SESSION_COLUMNS, TRIAL_DTYPES, read_trial_table
+
+STORE_FILE = 'trial_store.sqlite'
+PHASE_DIRS = dict(main='data', training='data_training', staircase='data_staircase')
+# participant_session_date.ext, without the _phases.csv, _session.json, ... files next to the main task data
+FILE_PATTERN = re.compile(r'^(?P<participant>[^_]+)_(?P<session_nr>[^_]+)_'
+                          r'(?P<date>\d{4}-\d{2}-\d{2}_\d{2}h\d{2}\.\d{2}\.\d{3})\.(?P<ext>trials|csv)$')
+
+SQL_TYPES = dict(f='REAL', i='INTEGER', S='TEXT')
+TRIAL_COLUMNS = list(TRIAL_DTYPES)
+TRIAL_KINDS = {column: np.dtype(dtype).kind for column, dtype in TRIAL_DTYPES.items()}
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    phase TEXT,
+    participant TEXT,
+    session_nr TEXT,
+    date TEXT,
+    {', '.join(f'{column} TEXT' for column in SESSION_COLUMNS if column not in ('participant', 'session_nr', 'date'))},
+    n_trials INTEGER
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session_id INTEGER REFERENCES sessions(session_id),
+    participant TEXT,
+    session_nr TEXT,
+    phase TEXT,
+    {', '.join(f'{column} {SQL_TYPES[TRIAL_KINDS[column]]}' for column in TRIAL_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS trials_index ON trials (participant, session_nr, phase, trial_count);
+CREATE INDEX IF NOT EXISTS trials_session ON trials (session_id);
+CREATE INDEX IF NOT EXISTS sessions_index ON sessions (participant, session_nr, phase);
+'''
+
+
+###################################
+# FUNCTIONS
+###################################
+def connect(store=STORE_FILE):
+    con = sqlite3.connect(store)
+    con.executescript(SCHEMA)
+    return con
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def find_data_files(root='.'):
+    """
+    (path, phase) of every trial data file below root; of a .trials file and its exported .csv only the .trials
+    """
+    files = []
+    for phase, directory in PHASE_DIRS.items():
+        directory = os.path.join(root, directory)
+        if not os.path.isdir(directory):
+            continue
+        names = os.listdir(directory)
+        for name in sorted(names):
+            match = FILE_PATTERN.match(name)
+            if match is None:
+                continue
+            if match['ext'] == 'csv' and name[:-len('csv')] + 'trials' in names:
+                continue
+            files.append((os.path.join(directory, name), phase))
+    return files
+
+
+def parse_value(text, kind):
+    """
+    typed value of a CSV field (None for 'None', for empty numbers and for fields missing from a cut-off row)
+    """
+    if text is None or text == 'None' or (kind != 'S' and text == ''):
+        return None
+    if kind == 'f':
+        return float(text)
+    if kind == 'i':
+        return int(float(text))
+    return text
+
+
+def read_csv_file(path):
+    """
+    session values and trial rows (dicts of TRIAL_COLUMNS) of a CSV data file
+    """
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    session = {column: rows[0].get(column) for column in SESSION_COLUMNS} if rows else {}
+    trials = [{column: parse_value(row[column], TRIAL_KINDS[column]) if column in row else None
+               for column in TRIAL_COLUMNS} for row in rows]
+    return session, trials
+
+
+def read_table_file(path):
+    """
+    session values and trial rows (dicts of TRIAL_COLUMNS) of a .trials data file
+    """
+    header, records = read_trial_table(path)
+    columns = {}
+    for column in TRIAL_COLUMNS:
+        if column not in records.dtype.names:
+            columns[column] = [None] * len(records)
+        elif TRIAL_KINDS[column] == 'f':
+            columns[column] = [None if np.isnan(value) else value for value in records[column].tolist()]
+        elif TRIAL_KINDS[column] == 'i':
+            columns[column] = [None if value == MISSING_INT else value for value in records[column].tolist()]
+        else:
+            columns[column] = [value.decode('utf-8') if value else None for value in records[column].tolist()]
+    trials = [dict(zip(TRIAL_COLUMNS, values)) for values in zip(*columns.values())]
+    return header['session'], trials
+
+
+def ingest_file(con, path, phase, size, mtime, digest):
+    """
+    (re)load one data file into the store, replacing its previous trials
+    """
+    try:
+        session, trials = read_table_file(path) if path.endswith('.trials') else read_csv_file(path)
+    except (ValueError, KeyError, UnicodeDecodeError, csv.Error) as e:
+        print(f'skipped {path}: {e}')
+        session, trials = {}, []
+    match = FILE_PATTERN.match(os.path.basename(path))
+    # participant, session and date from the file name where the file has no rows (abandoned runs)
+    values = dict(match.groupdict(), **{column: value for column, value in session.items() if value is not None})
+    values.pop('ext')
+    row = dict(path=path, size=size, mtime=mtime, hash=digest, phase=phase, n_trials=len(trials),
+               **{column: None if values.get(column) is None else str(values[column])
+                  for column in SESSION_COLUMNS})
+    with con:
+        old = con.execute('SELECT session_id FROM sessions WHERE path = ?', [path]).fetchone()
+        if old is not None:
+            con.execute('DELETE FROM trials WHERE session_id = ?', old)
+            con.execute('DELETE FROM sessions WHERE session_id = ?', old)
+        session_id = con.execute(f'INSERT INTO sessions ({", ".join(row)}) VALUES ({", ".join("?" * len(row))})',
+                                 list(row.values())).lastrowid
+        columns = ['session_id', 'participant', 'session_nr', 'phase'] + TRIAL_COLUMNS
+        con.executemany(f'INSERT INTO trials ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                        [[session_id, row['participant'], row['session_nr'], phase] + list(trial.values())
+                         for trial in trials])
+
+
+def ingest(root='.', store=STORE_FILE):
+    """
+    bring the store up to date with the data files below root, return the number of new, changed, unchanged and
+    removed files
+    """
+    con = connect(store)
+    known = {path: (size, mtime, digest) for path, size, mtime, digest
+             in con.execute('SELECT path, size, mtime, hash FROM sessions')}
+    counts = dict(new=0, changed=0, unchanged=0, removed=0)
+    files = find_data_files(root)
+    for path, phase in files:
+        stat = os.stat(path)
+        old = known.get(path)
+        if old is not None and old[:2] == (stat.st_size, stat.st_mtime):
+            counts['unchanged'] += 1
+            continue
+        digest = file_hash(path)
+        if old is not None and old[2] == digest:
+            with con:
+                con.execute('UPDATE sessions SET size = ?, mtime = ? WHERE path = ?', [stat.st_size, stat.st_mtime, path])
+            counts['unchanged'] += 1
+            continue
+        ingest_file(con, path, phase, stat.st_size, stat.st_mtime, digest)
+        counts['new' if old is None else 'changed'] += 1
+    for path in set(known) - {path for path, _ in files}:
+        with con:
+            con.execute('DELETE FROM trials WHERE session_id IN (SELECT session_id FROM sessions WHERE path = ?)', [path])
+            con.execute('DELETE FROM sessions WHERE path = ?', [path])
+        counts['removed'] += 1
+    con.close()
+    return counts
+
+
+def query(sql, params=(), store=STORE_FILE):
+    """
+    result of an SQL query on the store as a pandas DataFrame
+    """
+    import pandas as pd
+
+    con = connect(store)
+    try:
+        return pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ingest trial data files into an SQLite store')
+    parser.add_argument('--root', default='.', help='directory containing data/, data_training/, data_staircase/')
+    parser.add_argument('--store', default=STORE_FILE)
+    parser.add_argument('--query', default=None, help='SQL query to run on the store after ingesting')
+    args = parser.parse_args()
+
+    counts = ingest(args.root, args.store)
+    print(', '.join(f'{n} {state}' for state, n in counts.items()) + f' files ({args.store})')
+    if args.query:
+        print(query(args.query, store=args.store).to_string())
+    else:
+        print(query('SELECT phase, COUNT(*) AS sessions, SUM(n_trials) AS trials FROM sessions GROUP BY phase',
+                    store=args.store).to_string(index=False))
@@ -1,300 +1,414 @@
 ###################################
 # IMPORT PACKAGES
 ###################################
-import numpy as np
+import json
 import os
 from datetime import datetime
-from psychopy import gui, visual, core, data, event, monitors
-import ctypes  # for hiding the mouse cursor on Windows
+from psychopy import core, event
 
 import helper_functions as hf
-from RDK_3_sets import create_dot_motion_stimulus_n_sets
-
-print('Reminder: Press Q to quit.')
+from RDK_3_sets import create_dot_stims, set_dot_frame
+from frame_timing import FrameIntervalHistogram, flip_stats
+from profiling import PhaseProfiler
+from rdk_engine import DotMotionEngine, n_dots_for
+from refresh_calibration import get_frame_rate
+from response_keyboard import ResponseKeyboard
+from rng_streams import new_session_seed, trial_rng
+from scheduler import FrameScheduler, Phase
+from stimulus_cache import StimulusCache
+from stimulus_prefetch import StimulusPrefetcher
+from trial_table import TrialTableEncoder
+from trajectory import TrajectoryRecorder
+from trial_writer import TrialWriter
 
 ###################################
 # SESSION INFO
 ###################################
-# PARTICIPANT INFO POP-UP
 expName = 'confidence-pgACC-TUS'
 curecID = 'R88533/RE002'
-expInfo = {'participant nr': '999',
-           'eeg (y/n)': 'n',
-           'session nr': '1',
-           'age': '',
-           'gender (f/m/o)': '',
-           }
-dlg = gui.DlgFromDict(dictionary=expInfo, sortKeys=False,
-                      title=expName)
-if not dlg.OK:
-    core.quit()
 
 # TASK VARIABLES
-gv = dict(
+default_gv = dict(
     n_trials=300,  # number of trials - 300
     dot_display_time=1.0,  # duration of dot display, 1 second
     inter_trial_interval=[0.5, 1.0],  # duration of inter-trial interval, uniform distribution, 0.5-1 second
+    feedback_time=0.5,  # duration of the response feedback, 0.5 second
+    clear_time=1.0,  # duration of the blank screen at the end of a trial, 1 second
     response_keys=['o', 'p'],  # keys for CW and CCW responses
     low_coherence=0.2,  # low coherence - needs to be calibrated to the participant
     high_coherence=0.4,  # high coherence - needs to be calibrated to the participant
     low_distance=10,  # low distance - needs to be calibrated to the participant
     high_distance=30,  # high distance - needs to be calibrated to the participant
-    bonus_factor=0.1  # bonus factor times correct responses
-)
-
-###################################
-# DATA SAVING
-###################################
-# variables in info will be saved as participant data
-info = dict(
-    expName=expName,
-    curec_ID=curecID,
-    session_nr=expInfo['session nr'],
-    date=data.getDateStr(),
-    start_time=None,
-    end_time=None,
-
-    participant=expInfo['participant nr'],
-    age=expInfo['age'],
-    gender=expInfo['gender (f/m/o)'],
-
-    trial_count=0,  # trial counter
-    coherence=None,  # coherence level, 'low' or 'high'
-    distance=None,  # distance level, 'low' or 'high'
-    direction=None,  # direction of motion
-    reference_direction=None,  # reference direction, 'CW' or 'CCW'
-    response=None,  # response, 'CW' or 'CCW'
-    response_time=None,  # response time
-    confidence_rating=None,  # confidence rating
-    confidence_response_time=None,  # confidence response time
-)
-
-# start a csv file for saving the participant data
-log_vars = list(info.keys())
-if not os.path.exists('data'):
-    os.mkdir('data')
-filename = os.path.join('data', '%s_%s_%s' % (info['participant'], info['session_nr'], info['date']))
-datafile = open(filename + '.csv', 'w')
-datafile.write(','.join(log_vars) + '\n')
-datafile.flush()
-
-############################################
-# SET UP WINDOW, MOUSE, EEG TRIGGERS, CLOCK
-############################################
-# WINDOW
-mon = monitors.Monitor('maja_dell_1')
-win = visual.Window(
-    size=(1920, 1080),
-    units="deg",
-    screen=1,
-    fullscr=True,
-    color=(0.001, 0.001, 0.001),
-    colorSpace='rgb',
-    monitor=mon
-)
-frame_rate = win.getActualFrameRate()
-
-# MOUSE
-win.setMouseVisible(False)
-mouse = event.Mouse(visible=False, win=win)
-mouse.setVisible(False)
-# Explicitly hide the cursor on Windows
-if os.name == 'nt':  # Check if the OS is Windows
-    ctypes.windll.user32.ShowCursor(False)
-
-# EEG TRIGGERS
-triggers = dict(
-    experiment_start=1,
-    experiment_end=20
+    bonus_factor=0.1,  # bonus factor times correct responses
+    precompute_stimuli=False,  # generate all dot frames before the session and play them back from a memory-mapped cache
+    prefetch_stimuli=True,  # generate the next trial's dot frames in a background thread (if not precomputed)
+    profile=False,  # time every frame and trial phase, report and Chrome trace are saved next to the data file
+    record_trajectories=True,  # save the dot positions of every frame, quantised, next to the data file (see trajectory.py)
+    session_seed=None,  # seed of all trial randomness (None = new random seed each run, no stimulus cache reuse)
+    stimulus_cache_max_bytes=2 * 1024 ** 3  # stimulus cache is evicted (least recently used first) beyond this size
 )
-# Create an EEGConfig object
-send_triggers = expInfo['eeg (y/n)'].lower() == 'y'
-EEG_config = hf.EEGConfig(triggers, send_triggers)
 
-# CLOCK
-clock = core.Clock()
 
 ###################################
-# CREATE STIMULI
+# FUNCTIONS
 ###################################
-big_txt = visual.TextStim(win=win, text='Welcome!', height=2, pos=[0, 3], color='white', wrapWidth=20, font='Monospace')
-instructions_txt = visual.TextStim(win=win, text="\n\n\n\n\n\n Press SPACE to start.", height=1, pos=[0, 2], wrapWidth=30, color='white', font='Monospace')
-instructions_top_txt = visual.TextStim(win=win, text="Instructions", height=1, pos=[0, 7.5], wrapWidth=30, color='white', font='Monospace')
-dot_parameters = {
-    'n_dot_sets': 3,
-    'random_dot_behaviour': 'random_position',
-    'duration': gv['dot_display_time'],
-    'aperture_diameter': 8,
-    'fixation_diameter': 0.4,
-    'dot_diameter': 0.16,
-    'dot_density': 1,
-    'speed': 2
-}
-aperture_outline = visual.Circle(
-        win,
-        radius=dot_parameters['aperture_diameter'] / 2,
-        edges=100,
-        lineColor='white',  # White outline
-        lineWidth=5,  # Line thickness
-        units='deg',
-        fillColor=None  # No fill, just an outline
+def run_main(win, expInfo, calibration=None, text_stimuli=None):
+    """
+    Run the confidence task in an open window.
+
+    Parameters:
+    - win: the PsychoPy window (see hf.create_window)
+    - expInfo: participant info from the pop-up (see hf.get_participant_info)
+    - calibration: low_coherence, high_coherence, low_distance and high_distance from the staircase
+                   (the defaults in default_gv are used if None)
+    - text_stimuli: instruction texts shared with the other phases of the session (created if None)
+
+    Returns the number of correct responses.
+    """
+    gv = dict(default_gv, **(calibration or {}))
+
+    # All randomness of a trial comes from per-trial streams derived from this seed (see rng_streams.py)
+    session_seed = gv['session_seed'] if gv['session_seed'] is not None else new_session_seed()
+
+    # ---------------------------------
+    # DATA SAVING
+    # ---------------------------------
+    # variables in info will be saved as participant data
+    info = dict(
+        expName=expName,
+        curec_ID=curecID,
+        session_nr=expInfo['session nr'],
+        date=hf.get_date_str(),
+        start_time=None,
+        end_time=None,
+
+        participant=expInfo['participant nr'],
+        age=expInfo['age'],
+        gender=expInfo['gender (f/m/o)'],
+        session_seed=session_seed,  # trial i's streams are rng_streams.trial_rng(session_seed, i - 1, subsystem)
+
+        trial_count=0,  # trial counter
+        coherence=None,  # coherence level, 'low' or 'high'
+        distance=None,  # distance level, 'low' or 'high'
+        direction=None,  # direction of motion
+        reference_direction=None,  # reference direction, 'CW' or 'CCW'
+        response=None,  # response, 'CW' or 'CCW'
+        response_time=None,  # response time (s) from the onset of the reference
+        confidence_rating=None,  # confidence rating
+        confidence_response_time=None,  # confidence response time
+        dropped_frames=None,  # dropped frames during the dot display
+        max_frame_interval=None,  # longest interval between two dot display flips (s)
+        motion_duration=None,  # actual duration of the dot display (s)
     )
-fixation = visual.ShapeStim(
-        win,
-        vertices=[(-dot_parameters['fixation_diameter'] / 2, 0), (dot_parameters['fixation_diameter'] / 2, 0), (0, 0), 
-                  (0, dot_parameters['fixation_diameter'] / 2), (0, -dot_parameters['fixation_diameter'] / 2)],
-        lineWidth=4,
-        closeShape=False,
-        lineColor='white'
-    )
-
-###################################
-# INSTRUCTIONS
-###################################
-# Welcome
-big_txt.draw()
-instructions_txt.draw()
-win.flip()
-hf.exit_q(win)
-event.waitKeys(keyList=['space'])  # Show instructions until SPACE is pressed
-event.clearEvents()
-
-# Task reminder
-instructions_txt.text = (
-    "You are now ready for the confidence task.\n\n"
-    "As a reminder, you will see a cloud of dots moving in a certain direction. "
-    "After that, a reference direction will be shown. Your task is to decide "
-    "whether the overall direction of the dots was closer to the BLUE or the ORANGE side of the reference. "
-    "To make your choice, press the BLUE or ORANGE button on the keyboard. The fixation cross will change to the colour of your choice.\n\n\n\n"
-    "Press SPACE to continue."
-)
-instructions_txt.draw()
-win.flip()
-hf.exit_q(win)
-event.waitKeys(keyList=['space'])  # Show instructions until SPACE is pressed
-event.clearEvents()
-
-# Confidence reminder
-instructions_txt.text = (
-    "In some trials, you will be asked to rate your confidence in your decision on a scale from 50% to 100%.\n\n"
-    "The slider will start at a random position. Use the response keys to move the slider, and press SPACE to confirm your response.\n\n"
-    "To maximize your bonus, aim to make as many correct decisions as possible and accurately estimate your confidence.\n\n\n\n"
-    "Press SPACE to begin."
-)
-instructions_txt.draw()
-win.flip()
-hf.exit_q(win)
-event.waitKeys(keyList=['space'])  # Show instructions until SPACE is pressed
-event.clearEvents()
-
-
 
-###################################
-# TASK
-###################################
-EEG_config.send_trigger(EEG_config.triggers['experiment_start'])
-start_time = datetime.now()
-info['start_time'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
-correct_responses = 0
-
-for trial in range(gv['n_trials']):
-    trial += 1
-    # Set the direction, coherence, and reference direction for the trial
-    direction = round(np.random.uniform(1, 360), 2)  # randomly choose motion direction
-
-    if np.random.choice([True, False]):  # randomly choose low or high coherence
-        coherence = gv['high_coherence']  # this needs to be calibrated to the participant
-    else:
-        coherence = gv['low_coherence']
-
-    if np.random.choice([True, False]):  # randomly choose low or high distance
-        distance = gv['high_distance']  # this needs to be calibrated to the participant
-    else:
-        distance = gv['low_distance']
-
-    if np.random.choice([True, False]):  # randomly choose CW or CCW
-        reference_direction = 'CW'
-        reference = (direction + distance) % 360
-    else:
-        reference_direction = 'CCW'
-        reference = (direction - distance) % 360
-
-    print(f"Trial {trial}: direction={direction}, coherence={coherence}, distance={distance}, reference={reference}")
-
-    # Show fixation cross
-    stimuli = [aperture_outline, fixation]
-    delay = np.random.uniform(gv['inter_trial_interval'][0], gv['inter_trial_interval'][1])
-    hf.draw_all_stimuli(win, stimuli, delay)
+    # start a data file for saving the participant data
+    log_vars = list(info.keys())
+    if not os.path.exists('data'):
+        os.mkdir('data')
+    filename = os.path.join('data', '%s_%s_%s' % (info['participant'], info['session_nr'], info['date']))
+    # compact session header + binary trial rows, written by a background thread (CSV: trial_table.export_csv)
+    datafile = TrialWriter(filename + '.trials', log_vars, TrialTableEncoder(log_vars))
+
+    # ---------------------------------
+    # REFRESH RATE, EEG TRIGGERS, CLOCK
+    # ---------------------------------
+    # cached refresh rate of this monitor/resolution/screen, checked with a few flips (see refresh_calibration.py)
+    frame_rate, refresh_calibration = get_frame_rate(win)
+    print(f"Refresh rate: {frame_rate:.2f} Hz ({'validated cached calibration' if refresh_calibration['validated'] else 'measured'})")
+
+    # EEG TRIGGERS
+    triggers = dict(
+        experiment_start=1,
+        experiment_end=20
+    )
+    # Create an EEGConfig object
+    send_triggers = expInfo['eeg (y/n)'].lower() == 'y'
+    EEG_config = hf.EEGConfig(triggers, send_triggers)
+
+    # CLOCK
+    clock = core.Clock()
+
+    # ---------------------------------
+    # CREATE STIMULI
+    # ---------------------------------
+    if text_stimuli is None:
+        text_stimuli = hf.create_text_stimuli(win)
+    big_txt = text_stimuli['big_txt']
+    instructions_txt = text_stimuli['instructions_txt']
+    dot_parameters = {
+        'n_dot_sets': 3,
+        'random_dot_behaviour': 'random_position',
+        'duration': gv['dot_display_time'],
+        'aperture_diameter': 8,
+        'fixation_diameter': 0.4,
+        'dot_diameter': 0.16,
+        'dot_density': 1,
+        'speed': 2,
+        'signal_dots': 'different',  # 'different' = signal dots redrawn every frame, 'same' = fixed, 'lifetime' = limited lifetime
+        'kernel': 'inplace',  # reuse preallocated buffers for the per-frame dot update
+        'dtype': 'float64'
+    }
+    # aperture outline, fixation cross and one dot stimulus that every trial's dot frames are shown with
+    aperture_outline, fixation, dot_stim = create_dot_stims(win, n_dots_for(dot_parameters), dot_parameters)
+    # arcs and line of the reference direction, rotated to each trial's reference
+    reference_display = hf.ReferenceDisplay(win, dot_parameters['aperture_diameter'] / 2)
+    # confidence rating screen with pre-rendered labels
+    confidence_slider = hf.ConfidenceSlider(win, gv['response_keys'])
+    response_keyboard = ResponseKeyboard(win)
+
+    # ---------------------------------
+    # TRIAL PLAN
+    # ---------------------------------
+    # Draw the conditions of all trials up front, so that the dot stimuli can be precomputed
+    trial_plan = []
+    for trial_index in range(gv['n_trials']):
+        rng = trial_rng(session_seed, trial_index, 'conditions')
+        direction = round(rng.uniform(1, 360), 2)  # randomly choose motion direction
+
+        if rng.choice([True, False]):  # randomly choose low or high coherence
+            coherence = gv['high_coherence']  # this needs to be calibrated to the participant
+        else:
+            coherence = gv['low_coherence']
+
+        if rng.choice([True, False]):  # randomly choose low or high distance
+            distance = gv['high_distance']  # this needs to be calibrated to the participant
+        else:
+            distance = gv['low_distance']
+
+        if rng.choice([True, False]):  # randomly choose CW or CCW
+            reference_direction = 'CW'
+            reference = (direction + distance) % 360
+        else:
+            reference_direction = 'CCW'
+            reference = (direction - distance) % 360
+
+        delay = rng.uniform(gv['inter_trial_interval'][0], gv['inter_trial_interval'][1])  # inter-trial interval
+        confidence_trial = rng.choice([True, False, False])  # confidence rating on approximately a third of the trials
+
+        trial_plan.append(dict(direction=direction, coherence=coherence, distance=distance,
+                               reference_direction=reference_direction, reference=reference,
+                               delay=delay, confidence_trial=confidence_trial))
+
+    # Everything needed to regenerate any trial's frames with replay_trial.py
+    with open(filename + '_session.json', 'w') as f:
+        json.dump(dict(session_seed=session_seed, frame_rate=frame_rate, refresh_calibration=refresh_calibration,
+                       dot_parameters=dot_parameters, gv=gv), f, indent=2)
+
+    # Precompute the dot frames of every trial (or reuse them from the cache)
+    session_stimuli = None
+    prefetcher = None
+    if gv['precompute_stimuli']:
+        stimulus_cache = StimulusCache(max_bytes=gv['stimulus_cache_max_bytes'])
+        session_stimuli = stimulus_cache.load_or_generate(
+            frame_rate, dot_parameters, [(t['direction'], t['coherence']) for t in trial_plan], session_seed)
+    elif gv['prefetch_stimuli']:
+        # Otherwise generate each trial's frames in the background during the previous trial, starting with the first one
+        prefetcher = StimulusPrefetcher(frame_rate, dot_parameters, session_seed)
+        prefetcher.request(0, trial_plan[0]['direction'], trial_plan[0]['coherence'])
+
+    # ---------------------------------
+    # INSTRUCTIONS
+    # ---------------------------------
+    # Welcome
+    big_txt.text = 'Welcome!'
+    instructions_txt.text = "\n\n\n\n\n\n Press SPACE to start."  # the texts may have been used by the training
+    big_txt.draw()
+    instructions_txt.draw()
+    win.flip()
     hf.exit_q(win)
-
-    # Show dots
-    create_dot_motion_stimulus_n_sets(win, frame_rate, 180, 0.5, dot_parameters)
-
-    # Show reference direction
-    arc_CW = hf.draw_arc(win, dot_parameters['aperture_diameter'] / 2, reference, reference - 90, 'blue')
-    arc_CCW = hf.draw_arc(win, dot_parameters['aperture_diameter'] / 2, reference, reference + 90, 'orange')
-    ref_line = visual.Line(win, start=((dot_parameters['aperture_diameter'] / 2 - 1) * np.cos(np.deg2rad(reference)),
-                                       (dot_parameters['aperture_diameter'] / 2 - 1) * np.sin(np.deg2rad(reference))),
-                           end=((dot_parameters['aperture_diameter'] / 2 + 1) * np.cos(np.deg2rad(reference)),
-                                (dot_parameters['aperture_diameter'] / 2 + 1) * np.sin(np.deg2rad(reference))),
-                           lineColor='white', lineWidth=6)
-    stimuli = [aperture_outline, arc_CW, arc_CCW, ref_line, fixation]
-    hf.draw_all_stimuli(win, stimuli)
+    event.waitKeys(keyList=['space'])  # Show instructions until SPACE is pressed
+    event.clearEvents()
+
+    # Task reminder
+    instructions_txt.text = (
+        "You are now ready for the confidence task.\n\n"
+        "As a reminder, you will see a cloud of dots moving in a certain direction. "
+        "After that, a reference direction will be shown. Your task is to decide "
+        "whether the overall direction of the dots was closer to the BLUE or the ORANGE side of the reference. "
+        "To make your choice, press the BLUE or ORANGE button on the keyboard. The fixation cross will change to the colour of your choice.\n\n\n\n"
+        "Press SPACE to continue."
+    )
+    instructions_txt.draw()
+    win.flip()
     hf.exit_q(win)
-
-    # Wait for participant response
-    response, response_time = hf.check_key_press(win, gv['response_keys'])
-    if response == gv['response_keys'][0]:
-        chosen_direction = 'CW'
-        fixation.color = 'blue'
-    elif response == gv['response_keys'][1]:
-        chosen_direction = 'CCW'
-        fixation.color = 'orange'
-    if chosen_direction == reference_direction:
-        correct_responses += 1
-
-    # Response visual feedback
-    stimuli = [aperture_outline, arc_CW, arc_CCW, ref_line, fixation]
-    hf.draw_all_stimuli(win, stimuli, 0.5)
+    event.waitKeys(keyList=['space'])  # Show instructions until SPACE is pressed
+    event.clearEvents()
+
+    # Confidence reminder
+    instructions_txt.text = (
+        "In some trials, you will be asked to rate your confidence in your decision on a scale from 50% to 100%.\n\n"
+        "The slider will start at a random position. Use the response keys to move the slider, and press SPACE to confirm your response.\n\n"
+        "To maximize your bonus, aim to make as many correct decisions as possible and accurately estimate your confidence.\n\n\n\n"
+        "Press SPACE to begin."
+    )
+    instructions_txt.draw()
+    win.flip()
     hf.exit_q(win)
-
-    # Confidence rating on approximately a third of the trials  # MAJA - make this every trial?
-    confidence_rating = None
-    confidence_response_time = None
-    if np.random.choice([True, False, False]):
-        confidence_rating, confidence_response_time = hf.get_confidence_rating(win, gv)
-
-    # Clear the stimuli
-    fixation.color = 'white'
+    event.waitKeys(keyList=['space'])  # Show instructions until SPACE is pressed
+    event.clearEvents()
+
+
+
+    # ---------------------------------
+    # TASK
+    # ---------------------------------
+    EEG_config.send_trigger(EEG_config.triggers['experiment_start'])
+    start_time = datetime.now()
+    info['start_time'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
+    correct_responses = 0
+    frame_interval_histogram = FrameIntervalHistogram()  # frame intervals of all dot displays of the session
+    profiler = PhaseProfiler(enabled=gv['profile'])
+    scheduler = FrameScheduler(win, frame_rate, profiler)  # all timed phases are shown for whole numbers of frames
+    trajectory_recorder = None
+    if gv['record_trajectories']:
+        trajectory_recorder = TrajectoryRecorder(filename + '.traj', n_dots_for(dot_parameters),
+                                                 dot_parameters['aperture_diameter'] / 2,
+                                                 scheduler.frames(dot_parameters['duration']))
+
+    for trial_index, trial_conditions in enumerate(trial_plan):
+        trial = trial_index + 1
+        # Get the direction, coherence, and reference direction for the trial
+        direction = trial_conditions['direction']
+        coherence = trial_conditions['coherence']
+        distance = trial_conditions['distance']
+        reference_direction = trial_conditions['reference_direction']
+        reference = trial_conditions['reference']
+
+        print(f"Trial {trial}: direction={direction}, coherence={coherence}, distance={distance}, reference={reference}")
+
+        scheduler.trial = trial
+
+        # Show fixation cross
+        t = profiler.now()
+        stimuli = [aperture_outline, fixation]
+        scheduler.run(scheduler.phase('iti', trial_conditions['delay'], stimuli))
+        t = profiler.lap('iti', t, 'trial')
+
+        # Show dots
+        if session_stimuli is not None or prefetcher is not None:
+            if session_stimuli is not None:
+                positions, opacities = session_stimuli.trial(trial_index)
+            else:
+                positions, opacities = prefetcher.get(trial_index, direction, coherence)
+            n_motion_frames = len(positions)
+
+            def show_dots(frame):
+                set_dot_frame(dot_stim, positions[frame], opacities[frame], profiler)
+                if trajectory_recorder is not None:
+                    trajectory_recorder.record(frame, positions[frame], opacities[frame])
+        else:
+            engine = DotMotionEngine(frame_rate, direction, coherence, dot_parameters,
+                                     trial_rng(session_seed, trial_index, 'stimulus'))
+            n_motion_frames = engine.n_frames_for()
+
+            def show_dots(frame):
+                t_update = profiler.now()
+                dot_positions, dot_opacities = engine.step()
+                profiler.lap('update_dots', t_update)
+                set_dot_frame(dot_stim, dot_positions, dot_opacities, profiler)
+                if trajectory_recorder is not None:
+                    trajectory_recorder.record(frame, dot_positions, dot_opacities)
+        stimuli = [fixation, aperture_outline, dot_stim]
+        flip_times = scheduler.run(Phase('motion', n_motion_frames, stimuli, show_dots))
+        if trajectory_recorder is not None:
+            trajectory_recorder.write_trial(trial)  # quantised and written by a background thread
+        if prefetcher is not None and trial_index + 1 < len(trial_plan):
+            # Generate the next trial's frames while the participant responds
+            next_trial = trial_plan[trial_index + 1]
+            prefetcher.request(trial_index + 1, next_trial['direction'], next_trial['coherence'])
+        motion_timing = flip_stats(flip_times, frame_rate)
+        frame_interval_histogram.add(flip_times)
+        t = profiler.lap('motion', t, 'trial')
+
+        # Show reference direction
+        reference_display.set_reference(reference)
+        t = profiler.lap('reference_arcs', t, 'trial')
+        stimuli = [aperture_outline, reference_display.stimuli, fixation]
+        response_keyboard.arm()  # response times are measured from the flip that shows the reference
+        scheduler.run(Phase('reference', 1, stimuli))  # stays on screen until the response
+        t = profiler.lap('reference_display', t, 'trial')
+
+        # Wait for participant response
+        response, response_time = response_keyboard.wait_for_response(gv['response_keys'])
+        t = profiler.lap('response', t, 'trial')
+        if response == gv['response_keys'][0]:
+            chosen_direction = 'CW'
+            fixation.color = 'blue'
+        elif response == gv['response_keys'][1]:
+            chosen_direction = 'CCW'
+            fixation.color = 'orange'
+        if chosen_direction == reference_direction:
+            correct_responses += 1
+
+        # Response visual feedback
+        stimuli = [aperture_outline, reference_display.stimuli, fixation]
+        scheduler.run(scheduler.phase('feedback', gv['feedback_time'], stimuli))
+        t = profiler.lap('feedback', t, 'trial')
+
+        # Confidence rating on approximately a third of the trials  # MAJA - make this every trial?
+        confidence_rating = None
+        confidence_response_time = None
+        if trial_conditions['confidence_trial']:
+            confidence_rating, confidence_response_time = confidence_slider.rate(
+                trial_rng(session_seed, trial_index, 'confidence'))
+        t = profiler.lap('confidence', t, 'trial')
+
+        # Clear the stimuli
+        fixation.color = 'white'
+        scheduler.run(scheduler.phase('clear', gv['clear_time']))
+        t = profiler.lap('clear', t, 'trial')
+
+        # Save the data
+        info['trial_count'] = trial
+        info['coherence'] = coherence
+        info['distance'] = distance
+        info['direction'] = direction
+        info['reference_direction'] = reference_direction
+        info['response'] = chosen_direction
+        info['response_time'] = response_time
+        info['confidence_rating'] = confidence_rating
+        info['confidence_response_time'] = confidence_response_time
+        info['dropped_frames'] = motion_timing['dropped_frames']
+        info['max_frame_interval'] = motion_timing['max_frame_interval']
+        info['motion_duration'] = motion_timing['motion_duration']
+        datafile.write(info)
+        profiler.lap('csv_write', t, 'trial')
+
+    # END
+    frame_interval_histogram.write_csv(filename + '_frame_intervals.csv')
+    scheduler.write_csv(filename + '_phases.csv')  # planned vs achieved frames of every phase
+    print('Phases (late = more frames than planned):', scheduler.summary())
+    if profiler.enabled:
+        profiler.print_report(frame_rate)
+        profiler.write_report_csv(filename + '_profile.csv', frame_rate)
+        profiler.write_chrome_trace(filename + '_profile_trace.json')
+    if prefetcher is not None:
+        prefetcher.close()
+        print('Stimulus prefetch:', prefetcher.summary())
+    info['end_time'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
+    bonus = correct_responses * gv['bonus_factor']
+    instructions_txt.text = ("Well done! You have completed the task. \n\n"
+                             f"You made {correct_responses} correct responses out of {gv['n_trials']} trials. \n\n"
+                             f"Your bonus is £{bonus}. \n\n")
+    instructions_txt.draw()
     win.flip()
     hf.exit_q(win)
-    core.wait(1)
-
-    # Save the data
-    info['trial_count'] = trial
-    info['coherence'] = coherence
-    info['distance'] = distance
-    info['direction'] = direction
-    info['reference_direction'] = reference_direction
-    info['response'] = chosen_direction
-    info['response_time'] = response_time
-    info['confidence_rating'] = confidence_rating
-    info['confidence_response_time'] = confidence_response_time
-    datafile.write(','.join([str(info[var]) for var in log_vars]) + '\n')
-    datafile.flush()
-
-# END
-info['end_time'] = start_time.strftime("%Y-%m-%d %H:%M:%S")
-bonus = correct_responses * gv['bonus_factor']
-instructions_txt.text = ("Well done! You have completed the task. \n\n"
-                         f"You made {correct_responses} correct responses out of {gv['n_trials']} trials. \n\n"
-                         f"Your bonus is £{bonus}. \n\n")
-instructions_txt.draw()
-win.flip()
-hf.exit_q(win)
-event.waitKeys(keyList=['space'])  # show instructions until space is pressed
-event.clearEvents()
-
-# Close window
-win.close()
-core.quit()
+    event.waitKeys(keyList=['space'])  # show instructions until space is pressed
+    event.clearEvents()
+    datafile.close()
+    if trajectory_recorder is not None:
+        trajectory_recorder.close()
+
+    return correct_responses
+
+
+if __name__ == '__main__':
+    print('Reminder: Press Q to quit.')
+    expInfo = hf.get_participant_info(expName)
+    win = hf.create_window()
+    run_main(win, expInfo)
+    hf.draw_stats.print_report()  # draw calls and drawing time per frame of every scene
+
+    # Close window
+    win.close()
+    core.quit()
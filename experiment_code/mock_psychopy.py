@@ -0,0 +1,463 @@
+"""
+headless mock of the psychopy modules used by the experiment scripts
+
+install() registers fake psychopy, psychopy.visual, .core, .event, .gui, .data, .monitors and .hardware.keyboard
+modules, so main.py, training.py and staircase.py run without a display (see run_headless.py). Windows simulate flips
+at a configurable refresh rate, stims record their draw calls, and key presses come from a scripted input source.
+
+Simulated time is wall-clock time plus all skipped waits: core.wait() returns immediately and adds its duration,
+and win.flip() jumps to the next vsync of the simulated refresh rate. Python work between flips still takes real
+time, so a slow frame shows up as a dropped frame exactly like on a real display.
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import collections
+import math
+import random
+import sys
+import time
+import types
+import numpy as np
+
+
+###################################
+# CLASSES
+###################################
+class SimulatedClock:
+    """
+    session time in seconds: wall-clock time since start plus skipped time
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.skipped = 0.0
+
+    def now(self):
+        return time.perf_counter() - self.start + self.skipped
+
+    def skip(self, seconds):
+        self.skipped += max(seconds, 0.0)
+
+
+class RandomParticipant:
+    """
+    Fallback key source: presses a random allowed key after a uniformly random response time. It answers waitKeys
+    with the first requested key (e.g. 'space') and never presses keys that were not asked for, such as 'q'.
+    """
+
+    def __init__(self, keys=('o', 'p', 'space'), response_time=(0.3, 1.0), seed=None):
+        self.keys = list(keys)
+        self.response_time = response_time
+        self.rng = random.Random(seed)
+
+    def respond(self, key_list, blocking):
+        """
+        return (key, response time) or None
+        """
+        allowed = self.keys if key_list is None else [key for key in self.keys if key in key_list]
+        if not allowed:
+            if not blocking:
+                return None
+            allowed = [key_list[0]]
+        return self.rng.choice(allowed), self.rng.uniform(*self.response_time)
+
+
+class ScriptedInput:
+    """
+    Key source of the mock event module. script is a sequence of (key, delay) pairs: each key is pressed delay seconds
+    after the experiment first asks for a key that it could be. When the script is exhausted, participant
+    (a RandomParticipant by default) provides the keys.
+
+    like on a real keyboard, psychopy.event and hardware.keyboard.Keyboard each get every press in their own buffer:
+    a press read through one of them stays unread in the other until it is read or cleared there.
+    """
+
+    def __init__(self, script=(), participant=None):
+        self.script = collections.deque(script)
+        self.participant = participant if participant is not None else RandomParticipant()
+        self.pending = None  # (key, due time, scripted)
+        self.presses = []  # (key, time) of all delivered key presses
+        self.unread = dict(event=[], keyboard=[])  # presses read through the other device, still in this buffer
+
+    def poll(self, key_list, now, blocking=False, device='event'):
+        """
+        return (key, press time) if a key from key_list (None = any key) has been pressed by now, else None
+        (device: 'event' or 'keyboard', whose buffer is read first)
+        """
+        buffer = self.unread[device]
+        for i, (key, press_time) in enumerate(buffer):
+            if key_list is None or key in key_list:
+                del buffer[i]
+                return key, press_time
+        if self.pending is None:
+            if self.script:
+                key, delay = self.script.popleft()
+                self.pending = (key, now + delay, True)
+            else:
+                response = self.participant.respond(key_list, blocking)
+                if response is None:
+                    return None
+                self.pending = (response[0], now + response[1], False)
+        key, due, scripted = self.pending
+        if key_list is not None and key not in key_list:
+            if blocking and not scripted:
+                self.pending = None  # the random participant answers the new question instead
+            return None
+        if now < due:
+            return None
+        self.pending = None
+        self.presses.append((key, due))
+        for other, buffer in self.unread.items():
+            if other != device:
+                buffer.append((key, due))
+        return key, due
+
+    def clear(self, device):
+        self.unread[device].clear()
+
+    def next_due(self):
+        return self.pending[1] if self.pending is not None else None
+
+
+class MockBackend:
+    """
+    state shared by all mock modules: simulated clock, refresh rate, key source and recordings
+    """
+
+    def __init__(self, refresh_rate=60.0, script=(), participant=None, exp_info=None):
+        self.refresh_rate = refresh_rate
+        self.clock = SimulatedClock()
+        self.input = ScriptedInput(script, participant)
+        self.exp_info = exp_info or {}  # values filled into gui.DlgFromDict
+        self.draw_calls = collections.Counter()  # draw calls per stim class
+        self.flip_times = []
+        self.windows = []
+
+    def next_vsync(self):
+        """
+        skip to the next vsync of the simulated display and return its time
+        """
+        now = self.clock.now()
+        period = 1.0 / self.refresh_rate
+        vsync = (math.floor(now / period) + 1) * period
+        self.clock.skip(vsync - now)
+        return vsync
+
+    def summary(self):
+        intervals = np.diff(self.flip_times)
+        return dict(
+            refresh_rate=self.refresh_rate,
+            simulated_time=self.clock.now(),
+            flips=len(self.flip_times),
+            draw_calls=dict(self.draw_calls),
+            key_presses=len(self.input.presses),
+            max_frame_interval=float(intervals.max()) if len(intervals) else None,
+        )
+
+
+backend = None  # the installed MockBackend
+
+
+# ---------------------------------
+# visual
+# ---------------------------------
+class MockStim:
+    """
+    generic stimulus: stores all keyword arguments as attributes and records draw calls
+    """
+
+    def __init__(self, win=None, **kwargs):
+        self.win = win
+        self.autoDraw = False
+        self.__dict__.update(kwargs)
+
+    def draw(self, win=None):
+        backend.draw_calls[type(self).__name__] += 1
+
+    def setAutoDraw(self, value):
+        self.autoDraw = value
+
+
+class Circle(MockStim):
+    pass
+
+
+class Rect(MockStim):
+    def contains(self, *args, **kwargs):
+        return False
+
+
+class ShapeStim(MockStim):
+    pass
+
+
+class Line(MockStim):
+    pass
+
+
+class TextStim(MockStim):
+    pass
+
+
+class DotStim(MockStim):
+    pass
+
+
+class ElementArrayStim(MockStim):
+    """
+    like psychopy, xys and opacities are converted to float arrays on assignment
+    """
+
+    @property
+    def xys(self):
+        return self._xys
+
+    @xys.setter
+    def xys(self, value):
+        self._xys = np.array(value, dtype=float)
+
+    @property
+    def opacities(self):
+        return self._opacities
+
+    @opacities.setter
+    def opacities(self, value):
+        self._opacities = np.array(value, dtype=float)
+
+
+class Slider(MockStim):
+    def __init__(self, win=None, ticks=(1, 2, 3, 4, 5), labels=None, pos=(0, 0), size=(1, 0.1), **kwargs):
+        super().__init__(win, ticks=list(ticks), labels=labels, pos=pos, size=size, **kwargs)
+        self.markerPos = None
+        self.tickLines = MockStim(win)
+
+
+class Window:
+    def __init__(self, size=(800, 600), units='pix', screen=0, fullscr=False, color=(0, 0, 0), colorSpace='rgb',
+                 monitor=None, **kwargs):
+        self.size = size
+        self.units = units
+        self.screen = screen
+        self.fullscr = fullscr
+        self.color = color
+        self.monitor = monitor
+        self.recordFrameIntervals = False
+        self.frameIntervals = []
+        self.closed = False
+        self.on_flip = []
+        self.last_flip = None
+        backend.windows.append(self)
+
+    def flip(self, clearBuffer=True):
+        flip_time = backend.next_vsync()
+        for function, args, kwargs in self.on_flip:
+            function(*args, **kwargs)
+        self.on_flip = []
+        if self.recordFrameIntervals and self.last_flip is not None:
+            self.frameIntervals.append(flip_time - self.last_flip)
+        self.last_flip = flip_time
+        backend.flip_times.append(flip_time)
+        return flip_time
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self.on_flip.append((function, args, kwargs))
+
+    def getActualFrameRate(self, nIdentical=10, nMaxFrames=100, nWarmUpFrames=10, threshold=1):
+        return float(backend.refresh_rate)
+
+    def getMsPerFrame(self, nFrames=60, showVisual=False, msg='', msDelay=0.0):
+        period_ms = 1000.0 / backend.refresh_rate
+        return period_ms, 0.0, period_ms
+
+    def setMouseVisible(self, visibility):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+# ---------------------------------
+# core
+# ---------------------------------
+class Clock:
+    def __init__(self):
+        self.start = backend.clock.now()
+
+    def getTime(self):
+        return backend.clock.now() - self.start
+
+    def reset(self, newT=0.0):
+        self.start = backend.clock.now() + newT
+
+
+def wait(secs, hogCPUperiod=0.2):
+    backend.clock.skip(secs)
+
+
+def getTime():
+    return backend.clock.now()
+
+
+def quit():
+    for win in backend.windows:
+        win.close()
+    raise SystemExit(0)
+
+
+# ---------------------------------
+# event
+# ---------------------------------
+def getKeys(keyList=None, modifiers=False, timeStamped=False):
+    pressed = backend.input.poll(keyList, backend.clock.now(), device='event')
+    if pressed is None:
+        return []
+    key, press_time = pressed
+    if timeStamped is True:
+        return [(key, press_time)]
+    if timeStamped:
+        return [(key, press_time - timeStamped.start)]  # a core.Clock
+    return [key]
+
+
+def wait_for_key(key_list, max_wait, device='event'):
+    """
+    skip simulated time until a key from key_list is pressed, return (key, press time) or None after max_wait
+    """
+    start = backend.clock.now()
+    while backend.clock.now() - start < max_wait:
+        pressed = backend.input.poll(key_list, backend.clock.now(), blocking=True, device=device)
+        if pressed is not None:
+            return pressed
+        due = backend.input.next_due()
+        backend.clock.skip((due - backend.clock.now()) if due is not None else 0.001)
+    return None
+
+
+def waitKeys(maxWait=float('inf'), keyList=None, modifiers=False, timeStamped=False, clearEvents=True):
+    if clearEvents:
+        backend.input.clear('event')
+    pressed = wait_for_key(keyList, maxWait)
+    if pressed is None:
+        return None
+    return [pressed] if timeStamped else [pressed[0]]
+
+
+def clearEvents(eventType=None):
+    # keys of the scripted input are only pressed when they are read, so only the presses read through a Keyboard
+    # can be waiting in the event buffer
+    if eventType in (None, 'keyboard'):
+        backend.input.clear('event')
+
+
+class Mouse:
+    def __init__(self, visible=True, newPos=None, win=None):
+        self.visible = visible
+
+    def setVisible(self, visible):
+        self.visible = visible
+
+    def getPressed(self, getTime=False):
+        buttons = [0, 0, 0]
+        return (buttons, [0.0, 0.0, 0.0]) if getTime else buttons
+
+    def clickReset(self, buttons=(0, 1, 2)):
+        pass
+
+    def isPressedIn(self, shape, buttons=(0, 1, 2)):
+        return False
+
+    def getPos(self):
+        return np.array([0.0, 0.0])
+
+
+# ---------------------------------
+# hardware.keyboard
+# ---------------------------------
+class KeyPress:
+    def __init__(self, name, tDown, rt):
+        self.name = name
+        self.tDown = tDown  # press time on the simulated clock
+        self.rt = rt  # press time on the keyboard's clock
+        self.duration = None
+
+
+class Keyboard:
+    """
+    psychopy.hardware.keyboard.Keyboard on the scripted key source: every press carries its exact simulated press
+    time, like the timestamps of the psychtoolbox backend, however late the keyboard is read
+    """
+
+    def __init__(self, deviceName=None, device=-1, bufferSize=10000, waitForStart=False, clock=None, backend=None):
+        self.clock = clock if clock is not None else Clock()
+
+    def key_press(self, pressed):
+        key, press_time = pressed
+        return KeyPress(key, press_time, press_time - self.clock.start)
+
+    def getKeys(self, keyList=None, waitRelease=True, clear=True):
+        pressed = backend.input.poll(keyList, backend.clock.now(), device='keyboard')
+        return [] if pressed is None else [self.key_press(pressed)]
+
+    def waitKeys(self, maxWait=float('inf'), keyList=None, waitRelease=True, clear=True):
+        pressed = wait_for_key(keyList, maxWait, device='keyboard')
+        return None if pressed is None else [self.key_press(pressed)]
+
+    def clearEvents(self, eventType=None):
+        backend.input.clear('keyboard')
+
+
+# ---------------------------------
+# gui, data, monitors
+# ---------------------------------
+class DlgFromDict:
+    def __init__(self, dictionary, title='', sortKeys=True, **kwargs):
+        dictionary.update({key: value for key, value in backend.exp_info.items() if key in dictionary})
+        self.dictionary = dictionary
+        self.OK = True
+
+
+def getDateStr(format='%Y-%m-%d_%Hh%M.%S.%f'):
+    now = time.strftime('%Y-%m-%d_%Hh%M.%S')
+    return f'{now}.{int(time.time() * 1000) % 1000:03d}'
+
+
+class Monitor:
+    def __init__(self, name, width=None, distance=None, gamma=None, notes=None, useBits=None, verbose=True,
+                 currentCalib=None, autoLog=True):
+        self.name = name
+
+
+###################################
+# FUNCTIONS
+###################################
+def make_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def install(refresh_rate=60.0, script=(), participant=None, exp_info=None):
+    """
+    register the mock psychopy modules in sys.modules (before the experiment scripts are imported) and return the
+    MockBackend with the recordings
+    """
+    global backend
+    backend = MockBackend(refresh_rate, script, participant, exp_info)
+    visual = make_module('psychopy.visual', Window=Window, Circle=Circle, Rect=Rect, ShapeStim=ShapeStim, Line=Line,
+                         TextStim=TextStim, DotStim=DotStim, ElementArrayStim=ElementArrayStim, Slider=Slider)
+    core = make_module('psychopy.core', Clock=Clock, wait=wait, getTime=getTime, quit=quit)
+    event = make_module('psychopy.event', getKeys=getKeys, waitKeys=waitKeys, clearEvents=clearEvents, Mouse=Mouse)
+    gui = make_module('psychopy.gui', DlgFromDict=DlgFromDict)
+    data = make_module('psychopy.data', getDateStr=getDateStr)
+    monitors = make_module('psychopy.monitors', Monitor=Monitor)
+    keyboard = make_module('psychopy.hardware.keyboard', Keyboard=Keyboard, KeyPress=KeyPress)
+    hardware = make_module('psychopy.hardware', __path__=[], keyboard=keyboard)
+    modules = dict(visual=visual, core=core, event=event, gui=gui, data=data, monitors=monitors, hardware=hardware)
+    psychopy = make_module('psychopy', __path__=[], **modules)
+    sys.modules['psychopy'] = psychopy
+    for name, module in modules.items():
+        sys.modules['psychopy.' + name] = module
+    sys.modules['psychopy.hardware.keyboard'] = keyboard
+    return backend
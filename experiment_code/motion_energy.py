@@ -0,0 +1,253 @@
+"""
+motion evidence of every trial from the logged dot trajectories (see trajectory.py)
+
+for each frame of each trial of a main task session:
+- net_motion: mean velocity (deg/s, x and y) of the visible dots, from their displacement since the last update of
+  the same dot set (n_dot_sets frames earlier). Jumps longer than max_step (noise dots replotted at random positions,
+  dots wrapped around the aperture) are not motion and count as no displacement.
+- net_motion_along: net_motion projected on the trial's motion direction
+- effective_coherence: proportion of the dots that moved exactly one coherent step in the motion direction and were
+  visible before and after it, i.e. the coherence actually shown once wrap_around_circular reflections and the
+  no-dot zone around the fixation cross are taken into account
+- motion_energy: opponent spatiotemporal motion energy along the motion direction (Adelson & Bergen, 1985). The dots
+  are projected on the motion axis into a space-time image, which is filtered with complex Gabor filters tuned to the
+  dot speed in the motion direction and against it; the energy is the forward minus the backward filter power,
+  summed over space. motion_energy_contrast divides it by their sum. The temporal envelope (+-3 sigma of half a
+  temporal period, 1.5 s at 2 deg/s and 1 cycle/deg) is narrowed to at most max_kernel_fraction of the trial, and
+  the frames whose filter reaches beyond the start or end of the trial are NaN instead of filtering the zero padding.
+
+frames before every dot set has been updated twice have no displacement and are NaN. All trials of a session are
+processed as one array, sessions (participants) in parallel by a process pool.
+
+usage:
+    python motion_energy.py data/*.trials [--processes 4] [--output evidence.csv]
+    evidence = analyse_session('data/<participant>_<session>_<date>.trials')  # dict of (n_trials, n_frames) arrays
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import argparse
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from trajectory import Trajectories
+from trial_table import read_trial_table
+
+
+###################################
+# FUNCTIONS
+###################################
+def load_trajectories(data_path):
+    """
+    session description, trial records and stacked trajectories of a main task data file: positions
+    (n_trials, n_frames, n_dots, 2) and visible (n_trials, n_frames, n_dots), ordered like the trial records
+    """
+    base = os.path.splitext(data_path)[0]
+    with open(base + '_session.json') as f:
+        session = json.load(f)
+    header, trials = read_trial_table(data_path)
+    trajectories = Trajectories(base + '.traj')
+    trials = trials[np.isin(trials['trial_count'], trajectories.trials)]  # e.g. the last trial of a crashed run
+
+    n_frames = max((len(trajectories.frames(trial)) for trial in trials['trial_count']), default=0)
+    positions = np.full((len(trials), n_frames, trajectories.n_dots, 2), np.nan)
+    visible = np.zeros((len(trials), n_frames, trajectories.n_dots), dtype=bool)
+    for i, trial in enumerate(trials['trial_count']):
+        trial_positions, trial_visible = trajectories.trial(int(trial))
+        positions[i, :len(trial_positions)] = trial_positions
+        visible[i, :len(trial_visible)] = trial_visible
+    return dict(session, **header['session']), trials, positions, visible
+
+
+def dot_displacements(positions, visible, n_dot_sets):
+    """
+    displacement of every dot since the previous update of its set, and whether it was visible before and after
+    (frame f shows dot set f % n_dot_sets, the same dots as frame f - n_dot_sets)
+    """
+    displacements = np.full(positions.shape, np.nan)
+    displacements[:, n_dot_sets:] = positions[:, n_dot_sets:] - positions[:, :-n_dot_sets]
+    both_visible = np.zeros(visible.shape, dtype=bool)
+    both_visible[:, n_dot_sets:] = visible[:, n_dot_sets:] & visible[:, :-n_dot_sets]
+    return displacements, both_visible
+
+
+def space_time_images(positions, visible, directions, aperture_radius, bin_width):
+    """
+    number of visible dots per frame and position bin along each trial's motion axis: (n_trials, n_frames, n_bins)
+    """
+    n_trials, n_frames, n_dots, _ = positions.shape
+    radians = np.deg2rad(directions)[:, None, None]
+    along = positions[..., 0] * np.cos(radians) + positions[..., 1] * np.sin(radians)
+    n_bins = int(np.ceil(2 * aperture_radius / bin_width))
+    bins = np.clip(((along + aperture_radius) / bin_width).astype(int), 0, n_bins - 1)
+    valid = visible & ~np.isnan(along)
+    flat = (np.arange(n_trials * n_frames).reshape(n_trials, n_frames, 1) * n_bins + bins)[valid]
+    return np.bincount(flat, minlength=n_trials * n_frames * n_bins).reshape(n_trials, n_frames, n_bins)
+
+
+def gabor_kernel(speed, spatial_frequency, frame_rate, bin_width, max_frames=None):
+    """
+    complex space-time Gabor filter (n_kernel_frames, n_kernel_bins) whose carrier drifts at speed deg/s along the
+    axis (negative speed: against it). Its temporal envelope is narrowed where needed to fit in max_frames frames.
+    """
+    temporal_frequency = speed * spatial_frequency
+    sigma_x = 0.5 / spatial_frequency  # half a spatial period
+    sigma_t = 0.5 / abs(temporal_frequency)  # half a temporal period
+    half_frames = int(np.ceil(3 * sigma_t * frame_rate))
+    if max_frames is not None and half_frames > (max_frames - 1) // 2:
+        half_frames = max(1, (max_frames - 1) // 2)
+        sigma_t = half_frames / (3 * frame_rate)  # still +-3 sigma
+    x = np.arange(-np.ceil(3 * sigma_x / bin_width), np.ceil(3 * sigma_x / bin_width) + 1) * bin_width
+    t = np.arange(-half_frames, half_frames + 1) / frame_rate
+    t, x = np.meshgrid(t, x, indexing='ij')
+    envelope = np.exp(-x ** 2 / (2 * sigma_x ** 2) - t ** 2 / (2 * sigma_t ** 2))
+    return envelope * np.exp(2j * np.pi * (spatial_frequency * x - temporal_frequency * t))
+
+
+def filter_power(images, kernels):
+    """
+    power of the images (n_trials, n_frames, n_bins) filtered with each of the complex kernels of the same shape
+    ('same' size, zero padded), summed over space: one (n_trials, n_frames) array per kernel. All trials are
+    transformed in one single precision FFT, which is shared by the kernels.
+    """
+    n_frames, n_bins = images.shape[1:]
+    kernel_frames, kernel_bins = kernels[0].shape
+    shape = (n_frames + kernel_frames - 1, n_bins + kernel_bins - 1)
+    spectrum = np.fft.fft2(images.astype(np.complex64), s=shape, axes=(1, 2))
+    t0, x0 = kernel_frames // 2, kernel_bins // 2
+    powers = []
+    for kernel in kernels:
+        filtered = np.fft.ifft2(spectrum * np.fft.fft2(kernel.astype(np.complex64), s=shape), axes=(1, 2))
+        filtered = filtered[:, t0:t0 + n_frames, x0:x0 + n_bins]
+        powers.append((filtered.real ** 2 + filtered.imag ** 2).sum(axis=-1))
+    return powers
+
+
+def motion_evidence(positions, visible, directions, frame_rate, dot_parameters, spatial_frequency=1.0,
+                    bin_width=0.1, max_step=1.5, max_kernel_fraction=0.5):
+    """
+    net motion, effective coherence and motion energy of stacked trials (see the module docstring)
+
+    Parameters:
+    - positions, visible: (n_trials, n_frames, n_dots, 2) dot positions in deg and (n_trials, n_frames, n_dots)
+    - directions: motion direction of each trial (deg)
+    - frame_rate, dot_parameters: as in the session JSON written by main.py
+    - spatial_frequency: preferred spatial frequency of the motion energy filters (cycles/deg)
+    - bin_width: position bin of the space-time images (deg)
+    - max_step: longest displacement counted as motion, in coherent steps
+    - max_kernel_fraction: longest temporal support of the motion energy filters, as a fraction of the longest trial
+    """
+    n_dot_sets = dot_parameters.get('n_dot_sets', 3)
+    speed = dot_parameters.get('speed', 2)
+    aperture_radius = dot_parameters.get('aperture_diameter', 8) / 2
+    update_interval = n_dot_sets / frame_rate  # seconds between two updates of a dot set
+    step = speed * update_interval  # coherent displacement per update
+    radians = np.deg2rad(np.asarray(directions, dtype=float))
+    unit = np.stack([np.cos(radians), np.sin(radians)], axis=-1)[:, None, None, :]  # (n_trials, 1, 1, 2)
+
+    displacements, both_visible = dot_displacements(positions, visible, n_dot_sets)
+    lengths = np.sqrt(np.sum(displacements ** 2, axis=-1))
+    moving = both_visible & (lengths <= max_step * step)
+    n_visible = both_visible.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        net_motion = np.where(moving[..., None], displacements, 0).sum(axis=2) / n_visible[..., None] / update_interval
+    net_motion[:, :n_dot_sets] = np.nan
+
+    # coherent: one step along the motion direction, up to the int16 quantisation of the trajectories
+    tolerance = max(1e-6, 4 * aperture_radius / 32767)
+    off_step = np.sqrt(np.sum((displacements - step * unit) ** 2, axis=-1))
+    coherent = both_visible & (off_step <= tolerance)
+    effective_coherence = coherent.mean(axis=-1)
+    effective_coherence[:, :n_dot_sets] = np.nan
+
+    images = space_time_images(positions, visible, directions, aperture_radius, bin_width)
+    n_frames = positions.shape[1]
+    max_frames = int(max_kernel_fraction * n_frames)
+    kernels = [gabor_kernel(speed, spatial_frequency, frame_rate, bin_width, max_frames),
+               gabor_kernel(-speed, spatial_frequency, frame_rate, bin_width, max_frames)]
+    forward, backward = filter_power(images, kernels)
+    # no energy where the filter reaches beyond the frames of the trial (shorter trials are NaN padded)
+    half_frames = len(kernels[0]) // 2
+    trial_frames = np.sum(~np.isnan(positions[:, :, 0, 0]), axis=1)
+    frames = np.arange(n_frames)
+    edges = (frames < half_frames) | (frames >= trial_frames[:, None] - half_frames)
+    forward[edges] = np.nan
+    backward[edges] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        contrast = (forward - backward) / (forward + backward)
+
+    return dict(
+        net_motion=net_motion,
+        net_motion_along=np.sum(net_motion * unit[:, :, 0, :], axis=-1),
+        effective_coherence=effective_coherence,
+        motion_energy=forward - backward,
+        motion_energy_contrast=contrast,
+    )
+
+
+def analyse_session(data_path, **kwargs):
+    """
+    motion evidence of all trials of a main task data file (.trials with its .traj and _session.json), plus the
+    participant, session and trial columns needed to join it with the behaviour
+    """
+    session, trials, positions, visible = load_trajectories(data_path)
+    evidence = motion_evidence(positions, visible, trials['direction'], session['frame_rate'],
+                               session['dot_parameters'], **kwargs)
+    evidence.update(path=data_path, participant=session['participant'], session_nr=session['session_nr'],
+                    trial_count=trials['trial_count'], direction=trials['direction'], coherence=trials['coherence'])
+    return evidence
+
+
+def analyse_sessions(data_paths, processes=None, **kwargs):
+    """
+    analyse_session for many sessions, in parallel worker processes (processes=1 runs them here)
+    """
+    if processes == 1:
+        return [analyse_session(path, **kwargs) for path in data_paths]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(analyse_session, path, **kwargs) for path in data_paths]
+        return [future.result() for future in futures]
+
+
+def trial_summary(evidence):
+    """
+    one row per trial: nominal and mean effective coherence, mean net motion along the motion direction, mean motion
+    energy and contrast (pandas DataFrame)
+    """
+    import pandas as pd
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # mean of empty slice: trials without any evidence
+        return pd.DataFrame(dict(
+            participant=evidence['participant'],
+            session_nr=evidence['session_nr'],
+            trial_count=evidence['trial_count'],
+            direction=evidence['direction'],
+            coherence=evidence['coherence'],
+            effective_coherence=np.nanmean(evidence['effective_coherence'], axis=1),
+            net_motion_along=np.nanmean(evidence['net_motion_along'], axis=1),
+            motion_energy=np.nanmean(evidence['motion_energy'], axis=1),
+            motion_energy_contrast=np.nanmean(evidence['motion_energy_contrast'], axis=1),
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='motion evidence of logged dot trajectories')
+    parser.add_argument('data_paths', nargs='+', help='main task .trials files (with .traj and _session.json)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--spatial-frequency', type=float, default=1.0, help='motion energy filter, cycles/deg')
+    parser.add_argument('--output', default='motion_evidence.csv', help='per-trial summary CSV')
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    start = time.perf_counter()
+    results = analyse_sessions(args.data_paths, args.processes, spatial_frequency=args.spatial_frequency)
+    summary = pd.concat([trial_summary(evidence) for evidence in results], ignore_index=True)
+    summary.to_csv(args.output, index=False)
+    print(f'{len(summary)} trials of {len(results)} sessions in {time.perf_counter() - start:.2f} s, saved to {args.output}')
@@ -0,0 +1,102 @@
+"""
+hot-path profiler for the trial loop
+
+times every part of every frame (dot update, xys/opacities assignment, and per trial phase each draw call and the flip,
+e.g. 'motion/draw_ElementArrayStim' and 'motion/flip', see scheduler.FrameScheduler.run) and every trial phase
+(ITI, motion, reference arcs, response, confidence, csv write) with perf_counter_ns, and reports p50/p95/p99 per phase
+plus a Chrome trace (open in chrome://tracing or https://ui.perfetto.dev)
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import json
+import time
+import numpy as np
+
+
+###################################
+# CLASSES
+###################################
+class PhaseProfiler:
+    """
+    Collects (name, category, start, duration) events. A disabled profiler records nothing and its methods return
+    immediately, so the instrumented loops can always call it.
+
+    Phases are timed back to back with lap(), frame phases with category 'frame', trial phases with 'trial':
+        t = profiler.now()
+        ...                      # phase 1
+        t = profiler.lap('phase 1', t)
+        ...                      # phase 2
+        t = profiler.lap('phase 2', t)
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.events = []  # (name, category, start_ns, duration_ns)
+        self.origin_ns = time.perf_counter_ns()
+
+    def now(self):
+        """
+        current time in ns (0 if disabled)
+        """
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def lap(self, name, start_ns, category='frame'):
+        """
+        record a phase that started at start_ns and ends now, return now (the start of the next phase)
+        """
+        if not self.enabled:
+            return 0
+        now_ns = time.perf_counter_ns()
+        self.events.append((name, category, start_ns, now_ns - start_ns))
+        return now_ns
+
+    def report(self, frame_rate=None):
+        """
+        per phase: number of calls and p50/p95/p99/max duration in ms
+        (and p99 as a percentage of the frame budget for frame phases if frame_rate is given)
+        """
+        durations = {}
+        for name, category, _, duration_ns in self.events:
+            durations.setdefault((category, name), []).append(duration_ns)
+        report = []
+        for (category, name), phase_durations in durations.items():
+            phase_ms = np.array(phase_durations) / 1e6
+            p50, p95, p99 = np.percentile(phase_ms, [50, 95, 99])
+            row = dict(category=category, phase=name, n=len(phase_ms), p50_ms=p50, p95_ms=p95, p99_ms=p99,
+                       max_ms=phase_ms.max())
+            if frame_rate and category == 'frame':
+                row['p99_budget_percent'] = p99 / (1000 / frame_rate) * 100
+            report.append(row)
+        return report
+
+    def print_report(self, frame_rate=None):
+        if frame_rate:
+            print(f'Frame budget at {frame_rate:.1f} Hz: {1000 / frame_rate:.2f} ms')
+        print(f"{'category':<10}{'phase':<32}{'n':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'p99 % budget':>14}")
+        for row in self.report(frame_rate):
+            budget = f"{row['p99_budget_percent']:.1f}" if 'p99_budget_percent' in row else ''
+            print(f"{row['category']:<10}{row['phase']:<32}{row['n']:>7}{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}"
+                  f"{row['p99_ms']:>9.3f}{row['max_ms']:>9.3f}{budget:>14}")
+
+    def write_report_csv(self, path, frame_rate=None):
+        columns = ['category', 'phase', 'n', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'p99_budget_percent']
+        with open(path, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for row in self.report(frame_rate):
+                f.write(','.join(str(row.get(column, '')) for column in columns) + '\n')
+
+    def write_chrome_trace(self, path):
+        """
+        write all events in the Chrome trace event format (complete events, microseconds)
+        """
+        trace_events = [dict(name=name, cat=category, ph='X', pid=0, tid=0 if category == 'trial' else 1,
+                             ts=(start_ns - self.origin_ns) / 1000, dur=duration_ns / 1000)
+                        for name, category, start_ns, duration_ns in self.events]
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=trace_events, displayTimeUnit='ms'), f)
+
+
+# shared disabled profiler, the default of the instrumented functions
+NULL_PROFILER = PhaseProfiler(enabled=False)
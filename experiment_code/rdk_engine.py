@@ -0,0 +1,504 @@
+"""
+random dot kinematics for RDK_3_sets.py
+
+pure numpy (no psychopy), so the dot physics can be profiled, tested and reused without a display
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import numpy as np
+
+from frame_timing import frames_for_duration
+
+
+###################################
+# CLASSES
+###################################
+class SignalDotSelection:
+    """
+    Base class of the coherent (signal) dot selection strategies. A strategy keeps one boolean mask per dot set with
+    exactly n_coherent True entries and updates it in select(), which is called once per update of that set.
+    Subclass it and override select() to plug in a new strategy.
+    """
+
+    def __init__(self, n_dot_sets, n_dots, n_coherent, rng, parameters):
+        self.n_coherent = n_coherent
+        self.rng = rng
+        self.masks = np.zeros((n_dot_sets, n_dots), dtype=bool)
+        self.masks[:, :n_coherent] = True
+        for mask in self.masks:
+            rng.shuffle(mask)
+
+    def select(self, set_index):
+        """
+        Return the coherent dot mask of a set for the current frame.
+        """
+        return self.masks[set_index]
+
+
+class ReshuffleSelection(SignalDotSelection):
+    """
+    signal_dots='different': the choice of which dots are signal and which are noise is redrawn every frame.
+    The mask is shuffled in place (O(n), no allocation) instead of np.random.choice + np.setdiff1d.
+    """
+
+    def select(self, set_index):
+        mask = self.masks[set_index]
+        self.rng.shuffle(mask)
+        return mask
+
+
+class FixedSelection(SignalDotSelection):
+    """
+    signal_dots='same': signal and noise dots are drawn once and stay the same for the whole trial.
+    """
+
+
+class LimitedLifetimeSelection(SignalDotSelection):
+    """
+    signal_dots='lifetime': a dot stays a signal dot for 'signal_lifetime' updates of its set, then hands the role to a
+    randomly chosen noise dot. Ages start staggered, so only about n_coherent / signal_lifetime dots swap per frame.
+    At high coherence there can be fewer noise dots than expired signal dots; the expired dots that find no noise dot
+    to swap with stay signal dots and start a new lifetime.
+    """
+
+    def __init__(self, n_dot_sets, n_dots, n_coherent, rng, parameters):
+        super().__init__(n_dot_sets, n_dots, n_coherent, rng, parameters)
+        self.signal_lifetime = parameters.get('signal_lifetime', 10)  # in updates of the dot set
+        self.ages = rng.integers(0, self.signal_lifetime, size=(n_dot_sets, n_dots))
+
+    def select(self, set_index):
+        mask, ages = self.masks[set_index], self.ages[set_index]
+        ages += 1
+        expired = np.flatnonzero(mask & (ages >= self.signal_lifetime))
+        if len(expired):
+            noise = np.flatnonzero(~mask)
+            if len(noise) < len(expired):
+                ages[expired] = 0  # all expired dots start a new lifetime, the ones handed over below as noise
+                expired = self.rng.choice(expired, len(noise), replace=False) if len(noise) else expired[:0]
+            successors = self.rng.choice(noise, len(expired), replace=False)
+            mask[expired] = False
+            mask[successors] = True
+            ages[successors] = 0
+        return mask
+
+
+# random_dot_behaviour names: psychopy's DotStim noiseDots values plus the original RDK_3_sets names
+NOISE_DOT_BEHAVIOURS = {
+    'walk': 'walk',  # noise dots take a step in a new random direction every frame
+    'direction': 'direction',  # noise dots keep a random, but constant direction
+    'position': 'position',  # noise dots take a random position every frame
+    'random_walk': 'walk',
+    'random_position': 'position',
+}
+
+# signal_dots names (same values as psychopy's DotStim signalDots, used in training.py and staircase.py)
+SIGNAL_DOT_SELECTIONS = {
+    'different': ReshuffleSelection,
+    'same': FixedSelection,
+    'lifetime': LimitedLifetimeSelection,
+}
+
+# increased whenever the frames generated from a seed change, so that cached stimuli are regenerated
+ENGINE_VERSION = 2
+
+
+class DotMotionEngine:
+    """
+    Owns the dot state of a random dot motion stimulus with n interleaved sets of dots.
+    Each call to step() advances the set that is shown on the current frame and returns its positions and opacities.
+
+    Parameters:
+    - frame_rate: refresh rate of the display in Hz
+    - motion_direction: the direction of coherent motion (in degrees)
+    - motion_coherence: the proportion of dots moving in the coherent direction (0.0 to 1.0)
+    - parameters: dictionary of parameters including 'n_dot_sets', 'random_dot_behaviour', 'dot_life', 'duration',
+                  'aperture_diameter', 'fixation_diameter', 'dot_diameter', 'dot_density', 'speed', 'signal_dots',
+                  'kernel' and 'dtype'
+                  ('random_dot_behaviour': 'walk'/'random_walk', 'direction' or 'position'/'random_position';
+                   'dot_life': number of updates of its set a dot lives before it is replotted, -1 = infinite)
+                  ('signal_dots': 'different', 'same', 'lifetime' or a SignalDotSelection subclass)
+                  ('kernel': 'reference' allocates fresh arrays every frame like the original closures,
+                   'inplace' reuses buffers preallocated once per stimulus and is faster, with the same random draws
+                   and so the same frames up to rounding; 'dtype': 'float64' or 'float32')
+    - rng: numpy random Generator (a fresh one is created if None)
+    """
+
+    def __init__(self, frame_rate, motion_direction, motion_coherence, parameters, rng=None):
+        # Extract parameters from the dictionary, otherwise use default values
+        self.n_dot_sets = parameters.get('n_dot_sets', 3)
+        self.random_dot_behaviour = parameters.get('random_dot_behaviour', 'random_position')
+        self.dot_life = parameters.get('dot_life', -1)  # -1 = dots live for the whole stimulus
+        self.duration = parameters.get('duration', 5)
+        self.aperture_diameter = parameters.get('aperture_diameter', 8)
+        self.fixation_diameter = parameters.get('fixation_diameter', 0.3)
+        self.dot_diameter = parameters.get('dot_diameter', 0.16)  # Default dot diameter in degrees
+        self.dot_density = parameters.get('dot_density', 1)  # Default dot density in dots per degrees^-2 per second
+        self.speed = parameters.get('speed', 2)  # Default speed of motion in degrees per second
+        self.signal_dots = parameters.get('signal_dots', 'different')  # how signal dots are chosen
+        self.kernel = parameters.get('kernel', 'reference')  # 'reference' or 'inplace'
+        self.dtype = np.dtype(parameters.get('dtype', 'float64'))  # dtype of the inplace kernel buffers
+        self.motion_direction = motion_direction
+        self.motion_coherence = motion_coherence
+        self.rng = np.random.default_rng() if rng is None else rng
+
+        # Calculate derived parameters
+        self.aperture_radius = self.aperture_diameter / 2
+        self.fixation_exclusion_radius = self.fixation_diameter + 0.02  # No-dots zone radius around the fixation cross
+        self.n_dots = n_dots_for(parameters)  # Number of dots based on density and aperture area
+        self.frame_rate = frame_rate
+        self.frame_duration = 1.0 / frame_rate  # e.g., 60Hz --> 1/60 = 0.0167 seconds
+        set_speed = self.speed * self.n_dot_sets  # Adjust speed for multiple sets of dots
+        self.move_distance = set_speed * self.frame_duration  # Distance a coherent dot moves in one frame
+        self.n_coherent = int(self.n_dots * motion_coherence)
+
+        # Compute coherent movement vectors
+        motion_direction_rad = np.deg2rad(motion_direction)
+        self.coherent_move_x = np.cos(motion_direction_rad) * self.move_distance
+        self.coherent_move_y = np.sin(motion_direction_rad) * self.move_distance
+
+        if self.kernel not in ('reference', 'inplace'):
+            raise ValueError(f"unknown kernel '{self.kernel}', use 'reference' or 'inplace'")
+        if self.kernel == 'reference':
+            self.dtype = np.dtype('float64')
+
+        # All n sets of dots live in one contiguous (n_dot_sets, n_dots, 2) array, filled in one vectorized call,
+        # with a matching (n_dot_sets, n_dots) opacity array
+        self.positions = self.generate_random_dots(self.n_dot_sets, self.n_dots).astype(self.dtype, copy=False)
+        self.opacities = np.ones((self.n_dot_sets, self.n_dots), dtype=self.dtype)
+        self.frame_count = 0
+
+        # Noise dot behaviour, with a constant direction per dot for 'direction' noise
+        if self.random_dot_behaviour not in NOISE_DOT_BEHAVIOURS:
+            raise ValueError(f"unknown random_dot_behaviour '{self.random_dot_behaviour}', "
+                             f"use one of {list(NOISE_DOT_BEHAVIOURS)}")
+        self.noise_mode = NOISE_DOT_BEHAVIOURS[self.random_dot_behaviour]
+        if self.noise_mode == 'direction':
+            noise_directions = self.rng.random((self.n_dot_sets, self.n_dots)) * 2 * np.pi
+            self.noise_moves = np.empty((self.n_dot_sets, self.n_dots, 2), dtype=self.dtype)
+            np.multiply(np.cos(noise_directions), self.move_distance, out=self.noise_moves[..., 0])
+            np.multiply(np.sin(noise_directions), self.move_distance, out=self.noise_moves[..., 1])
+
+        # Finite dot lifetime: per-dot age counters, staggered so that dots do not all die on the same frame
+        if self.dot_life > 0:
+            self.dot_ages = self.rng.integers(0, self.dot_life, size=(self.n_dot_sets, self.n_dots))
+
+        # Coherent dot selection strategy
+        selection_class = SIGNAL_DOT_SELECTIONS.get(self.signal_dots, self.signal_dots)
+        if not (isinstance(selection_class, type) and issubclass(selection_class, SignalDotSelection)):
+            raise ValueError(f"unknown signal_dots '{self.signal_dots}', use one of {list(SIGNAL_DOT_SELECTIONS)}")
+        self.selection = selection_class(self.n_dot_sets, self.n_dots, self.n_coherent, self.rng, parameters)
+
+        if self.kernel == 'inplace':
+            self.allocate_buffers()
+
+    def allocate_buffers(self):
+        """
+        Preallocate all scratch arrays of the inplace kernel, so that a frame update does not allocate.
+        """
+        n_dots, dtype = self.n_dots, self.dtype
+        self._random = np.empty(n_dots, dtype=bool)
+        self._outside = np.empty(n_dots, dtype=bool)
+        self._dead = np.empty(n_dots, dtype=bool)
+        self._dead_2d = self._dead[:, None]
+        self._angles = np.empty(n_dots, dtype=dtype)
+        self._radii = np.empty(n_dots, dtype=dtype)
+        self._dist2 = np.empty(n_dots, dtype=dtype)
+        self._scratch = np.empty(n_dots, dtype=dtype)
+        self._move = np.empty((n_dots, 2), dtype=dtype)
+        self._candidates = np.empty((n_dots, 2), dtype=dtype)
+        self._coherent_move = np.array([self.coherent_move_x, self.coherent_move_y], dtype=dtype)
+        self._two = np.array(2, dtype=dtype)
+        # Column and broadcast views are created once so the kernel does not rebuild them every frame
+        self._coherent_2d = [mask[:, None] for mask in self.selection.masks]
+        self._random_2d = self._random[:, None]
+        self._outside_2d = self._outside[:, None]
+        self._move_x, self._move_y = self._move[:, 0], self._move[:, 1]
+        self._candidates_x, self._candidates_y = self._candidates[:, 0], self._candidates[:, 1]
+        self.n_random = n_dots - self.n_coherent  # every selection strategy keeps n_coherent signal dots
+        if self.noise_mode == 'direction':
+            self._noise_moves_x = [moves[:, 0] for moves in self.noise_moves]
+            self._noise_moves_y = [moves[:, 1] for moves in self.noise_moves]
+        self._set_views = [(self.positions[i], self.positions[i, :, 0], self.positions[i, :, 1], self.opacities[i])
+                           for i in range(self.n_dot_sets)]
+        # Squared radii, so that the kernel compares squared distances and never takes a square root
+        self._aperture_radius2 = self.aperture_radius ** 2
+        self._exclusion_radius2 = self.fixation_exclusion_radius ** 2
+
+    def generate_random_dots(self, *shape):
+        """
+        Generates dots uniformly within a circular aperture, as an array of shape (*shape, 2),
+        e.g. generate_random_dots(n_dots) or generate_random_dots(n_dot_sets, n_dots).
+        """
+        angles = self.rng.random(shape) * 2 * np.pi  # Random angles for dot direction
+        radii = np.sqrt(self.rng.random(shape)) * self.aperture_radius  # Random radii (for circular area)
+        dots = np.empty(shape + (2,))
+        np.multiply(radii, np.cos(angles), out=dots[..., 0])  # Convert polar to Cartesian coordinates (x)
+        np.multiply(radii, np.sin(angles), out=dots[..., 1])  # Convert polar to Cartesian coordinates (y)
+        return dots
+
+    def wrap_around_circular(self, dot_positions, move_x, move_y):
+        """
+        Implement circular wrapping. When a dot leaves one side of the aperture, it moves back,
+        reflects to the other side, and the movement is re-done.
+        """
+        # Calculate distance from center for each dot
+        distances_from_center = np.sqrt(dot_positions[:, 0] ** 2 + dot_positions[:, 1] ** 2)
+        outside_aperture = distances_from_center > self.aperture_radius
+
+        if np.any(outside_aperture):
+            # Move the dot back to its previous position (undo the movement)
+            dot_positions[outside_aperture, 0] -= move_x[outside_aperture]
+            dot_positions[outside_aperture, 1] -= move_y[outside_aperture]
+
+            # Reflect across the center
+            dot_positions[outside_aperture, 0] *= -1
+            dot_positions[outside_aperture, 1] *= -1
+
+            # Re-apply the movement to the reflected position
+            dot_positions[outside_aperture, 0] += move_x[outside_aperture]
+            dot_positions[outside_aperture, 1] += move_y[outside_aperture]
+
+        return dot_positions
+
+    def compute_dot_opacity(self, dot_positions):
+        """
+        Set opacity based on whether a dot is in the no-dot zone or outside it.
+        Dots inside the no-dot zone will have opacity 0 (invisible), others will have opacity 1 (visible).
+        """
+        distances_from_center = np.sqrt(dot_positions[:, 0] ** 2 + dot_positions[:, 1] ** 2)
+        opacities = np.ones(len(dot_positions))  # Default all opacities to 1 (visible)
+        inside_no_dot_zone = distances_from_center < self.fixation_exclusion_radius
+        opacities[inside_no_dot_zone] = 0  # Make dots inside the no-dot zone transparent
+        return opacities
+
+    def replot_expired_dots(self, set_index):
+        """
+        Age the dots of one set by one update and replot the dots that reached dot_life at a random position
+        (with a new random direction for 'direction' noise).
+        """
+        ages = self.dot_ages[set_index]
+        ages += 1
+        dead = ages >= self.dot_life
+        n_dead = np.count_nonzero(dead)
+        if n_dead:
+            ages[dead] = 0
+            self.positions[set_index][dead] = self.generate_random_dots(n_dead)
+            if self.noise_mode == 'direction':
+                new_directions = self.rng.random(n_dead) * 2 * np.pi
+                self.noise_moves[set_index][dead] = np.column_stack((np.cos(new_directions), np.sin(new_directions))) * self.move_distance
+
+    def update_dots(self, set_index):
+        """
+        Update the positions of the dots of one set, with the coherent and random assignment from the selection strategy.
+        """
+        dot_positions = self.positions[set_index]
+
+        # Replot dots that reached the end of their lifetime before they move
+        if self.dot_life > 0:
+            self.replot_expired_dots(set_index)
+
+        # Assign which dots are coherent and which are random for this frame (boolean masks)
+        coherent_indices = self.selection.select(set_index)
+        random_indices = ~coherent_indices
+
+        # Move coherent dots
+        dot_positions[coherent_indices, 0] += self.coherent_move_x
+        dot_positions[coherent_indices, 1] += self.coherent_move_y
+
+        if self.noise_mode in ('walk', 'direction'):
+            if self.noise_mode == 'walk':
+                # Compute random movement vectors
+                random_angles = self.rng.random(np.count_nonzero(random_indices)) * 2 * np.pi  # Random angles for random dots
+                random_move_x = np.cos(random_angles) * self.move_distance  # Random movement in x
+                random_move_y = np.sin(random_angles) * self.move_distance  # Random movement in y
+            else:
+                # Each random dot keeps its own constant direction
+                random_move_x = self.noise_moves[set_index][random_indices, 0]
+                random_move_y = self.noise_moves[set_index][random_indices, 1]
+            # Move random dots
+            dot_positions[random_indices, 0] += random_move_x
+            dot_positions[random_indices, 1] += random_move_y
+            # Combine movement vectors into one array for all dots
+            move_x = np.zeros_like(dot_positions[:, 0])
+            move_y = np.zeros_like(dot_positions[:, 1])
+            move_x[coherent_indices] = self.coherent_move_x
+            move_y[coherent_indices] = self.coherent_move_y
+            move_x[random_indices] = random_move_x
+            move_y[random_indices] = random_move_y
+
+        else:
+            # Reposition random dots within the aperture instead of doing random walk
+            dot_positions[random_indices] = self.generate_random_dots(np.count_nonzero(random_indices))
+            # Wrap coherent dots that move outside the aperture (random dots don't need wrapping as they are reset)
+            move_x = np.zeros_like(dot_positions[:, 0])
+            move_y = np.zeros_like(dot_positions[:, 1])
+            move_x[coherent_indices] = self.coherent_move_x
+            move_y[coherent_indices] = self.coherent_move_y
+
+        dot_positions = self.wrap_around_circular(dot_positions, move_x, move_y)
+
+        # Compute dot opacities (transparent for dots in the no-dot zone, visible otherwise)
+        dot_opacity = self.compute_dot_opacity(dot_positions)
+
+        return dot_positions, dot_opacity
+
+    def random_unit_moves(self, move_x, move_y, distance):
+        """
+        Fill move_x and move_y in place with moves of the given length in uniformly random directions.
+        """
+        angles = self._angles[:len(move_x)]
+        self.rng.random(out=angles, dtype=self.dtype)
+        angles *= 2 * np.pi
+        np.cos(angles, out=move_x)
+        np.sin(angles, out=move_y)
+        move_x *= distance
+        move_y *= distance
+
+    def random_positions_inplace(self, x_positions, y_positions):
+        """
+        Fill x_positions and y_positions in place with positions drawn uniformly within the circular aperture.
+        """
+        radii = self._radii[:len(x_positions)]
+        self.random_unit_moves(x_positions, y_positions, 1)
+        self.rng.random(out=radii, dtype=self.dtype)
+        np.sqrt(radii, out=radii)  # Random radii (for circular area)
+        radii *= self.aperture_radius
+        x_positions *= radii
+        y_positions *= radii
+
+    def wrap_and_opacity_inplace(self, dot_positions, x_positions, y_positions, opacities):
+        """
+        Fused circular wrapping and no-dot-zone opacity on squared distances. The squared distances computed for the
+        wrap test are reused for the opacity unless a dot had to be reflected.
+        """
+        dist2, scratch = self._dist2, self._scratch
+        np.multiply(x_positions, x_positions, out=dist2)
+        np.multiply(y_positions, y_positions, out=scratch)
+        dist2 += scratch
+
+        outside = self._outside
+        np.greater(dist2, self._aperture_radius2, out=outside)
+        if outside.any():
+            # Undo the movement, reflect across the center and re-apply the movement: -(p - m) + m = 2m - p,
+            # written (and the squared distance updated) only where a dot is outside
+            np.multiply(self._move, self._two, out=self._candidates)
+            np.subtract(self._candidates, dot_positions, out=dot_positions, where=self._outside_2d)
+            np.multiply(x_positions, x_positions, out=dist2, where=outside)
+            np.multiply(y_positions, y_positions, out=scratch, where=outside)
+            np.add(dist2, scratch, out=dist2, where=outside)
+
+        # Dots inside the no-dot zone get opacity 0 (invisible), others 1 (visible)
+        np.greater_equal(dist2, self._exclusion_radius2, out=opacities)
+        return opacities
+
+    def replot_expired_dots_inplace(self, set_index, x_positions, y_positions):
+        """
+        Inplace version of replot_expired_dots: new positions (and directions) are only drawn for the dead dots, into
+        the front of the candidate buffers, and scattered with boolean masks of the same shape (no index arrays).
+        """
+        ages, dead = self.dot_ages[set_index], self._dead
+        ages += 1
+        np.greater_equal(ages, self.dot_life, out=dead)
+        n_dead = np.count_nonzero(dead)
+        if n_dead:
+            np.copyto(ages, 0, where=dead)
+            new_x, new_y = self._candidates_x[:n_dead], self._candidates_y[:n_dead]
+            self.random_positions_inplace(new_x, new_y)
+            x_positions[dead] = new_x
+            y_positions[dead] = new_y
+            if self.noise_mode == 'direction':
+                # New direction for replotted dots
+                self.random_unit_moves(new_x, new_y, self.move_distance)
+                self._noise_moves_x[set_index][dead] = new_x
+                self._noise_moves_y[set_index][dead] = new_y
+
+    def update_dots_inplace(self, set_index):
+        """
+        Inplace version of update_dots for one dot set: same dynamics, but every intermediate result is written into
+        buffers from allocate_buffers(), so a frame update allocates no arrays.
+        """
+        dot_positions, x_positions, y_positions, opacities = self._set_views[set_index]
+        move = self._move
+
+        # Replot dots that reached the end of their lifetime before they move
+        if self.dot_life > 0:
+            self.replot_expired_dots_inplace(set_index, x_positions, y_positions)
+
+        # Assign which dots are coherent and which are random for this frame
+        coherent = self.selection.select(set_index)
+        np.logical_not(coherent, out=self._random)
+
+        # Random values are only drawn for the n_random noise dots, then scattered to them
+        new_x, new_y = self._candidates_x[:self.n_random], self._candidates_y[:self.n_random]
+        if self.noise_mode == 'walk':
+            # Random dots take a step in a random direction
+            self.random_unit_moves(new_x, new_y, self.move_distance)
+            self._move_x[self._random] = new_x
+            self._move_y[self._random] = new_y
+        elif self.noise_mode == 'direction':
+            # Random dots take a step in their own constant direction
+            np.copyto(move, self.noise_moves[set_index])
+        else:
+            # Reposition random dots within the aperture, they do not move (and are not wrapped)
+            move.fill(0)
+            self.random_positions_inplace(new_x, new_y)
+            x_positions[self._random] = new_x
+            y_positions[self._random] = new_y
+        np.copyto(move, self._coherent_move, where=self._coherent_2d[set_index])
+        dot_positions += move
+
+        dot_opacity = self.wrap_and_opacity_inplace(dot_positions, x_positions, y_positions, opacities)
+        return dot_positions, dot_opacity
+
+    def n_frames_for(self, duration=None):
+        """
+        Number of frames the display loop shows for a duration (defaults to the 'duration' parameter),
+        the same frame count the frame scheduler plans for the motion phase.
+        """
+        if duration is None:
+            duration = self.duration
+        return frames_for_duration(duration, self.frame_rate)
+
+    def step(self):
+        """
+        Advance the dot set shown on the current frame and return its positions and opacities.
+        The returned arrays are views into the engine's state and change when this set is updated again.
+        """
+        # Select the appropriate dot set for the current frame
+        current_set = self.frame_count % self.n_dot_sets
+
+        # Update dots for the current set and get their opacities
+        if self.kernel == 'inplace':
+            self.update_dots_inplace(current_set)
+        else:
+            _, self.opacities[current_set] = self.update_dots(current_set)
+        self.frame_count += 1
+
+        # Views into the contiguous set arrays, no copy
+        return self.positions[current_set], self.opacities[current_set]
+
+    def frames(self, n_frames=None):
+        """
+        Run n_frames steps (defaults to the number of frames in 'duration') and return all of them as
+        positions (n_frames, n_dots, 2) and opacities (n_frames, n_dots).
+        """
+        if n_frames is None:
+            n_frames = self.n_frames_for()
+        positions = np.empty((n_frames, self.n_dots, 2), dtype=self.dtype)
+        opacities = np.empty((n_frames, self.n_dots), dtype=self.dtype)
+        for frame in range(n_frames):
+            positions[frame], opacities[frame] = self.step()
+        return positions, opacities
+
+
+###################################
+# FUNCTIONS
+###################################
+def n_dots_for(parameters):
+    """
+    number of dots of one dot set: 'dot_density' dots per degree^2 of the aperture
+    """
+    aperture_radius = parameters.get('aperture_diameter', 8) / 2
+    return int(parameters.get('dot_density', 1) * np.pi * aperture_radius ** 2)
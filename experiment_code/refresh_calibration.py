@@ -0,0 +1,96 @@
+"""
+cached refresh rate calibration per monitor profile, resolution and screen
+
+the refresh rate is measured once (a few seconds of flips) and stored with its frame interval jitter in a JSON file.
+Later sessions on the same setup only validate it with a handful of flips and re-measure when the validation fails,
+instead of blocking on win.getActualFrameRate() (which can also return None) at every start.
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import json
+import os
+import time
+import numpy as np
+
+CALIBRATION_FILE = 'refresh_calibration.json'
+
+
+###################################
+# FUNCTIONS
+###################################
+def calibration_key(win):
+    """
+    monitor profile, resolution and screen of a window, e.g. 'maja_dell_1|1920x1080|screen1'
+    """
+    monitor = getattr(win.monitor, 'name', None) or 'default'
+    width, height = (int(size) for size in win.size)
+    return f'{monitor}|{width}x{height}|screen{win.screen}'
+
+
+def flip_intervals(win, n_frames, n_warmup=5):
+    """
+    flip the (empty) window n_warmup + n_frames times and return the last n_frames - 1 intervals in seconds
+    """
+    for _ in range(n_warmup):
+        win.flip()
+    flip_times = np.array([win.flip() for _ in range(n_frames)])
+    return np.diff(flip_times)
+
+
+def measure_refresh(win, n_frames=120):
+    """
+    measure the refresh rate (from the median frame interval) and the frame interval jitter (SD in ms)
+    """
+    intervals = flip_intervals(win, n_frames, n_warmup=10)
+    return dict(
+        refresh_rate=float(1 / np.median(intervals)),
+        jitter_ms=float(np.std(intervals) * 1000),
+        n_frames=n_frames,
+        measured=time.strftime('%Y-%m-%d %H:%M:%S'),
+    )
+
+
+def validate_refresh(win, refresh_rate, n_frames=12, tolerance=0.05):
+    """
+    True if the median interval of a few flips is within tolerance (fraction of a frame) of the calibrated period
+    """
+    intervals = flip_intervals(win, n_frames)
+    period = 1 / refresh_rate
+    return bool(abs(np.median(intervals) - period) <= tolerance * period)
+
+
+def load_calibrations(path=CALIBRATION_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:  # corrupt file, calibrate again
+        return {}
+
+
+def save_calibrations(calibrations, path=CALIBRATION_FILE):
+    # write to a temporary file first, so an interrupted write never leaves a broken cache
+    with open(path + '.tmp', 'w') as f:
+        json.dump(calibrations, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def get_frame_rate(win, path=CALIBRATION_FILE, n_measure=120, n_validate=12):
+    """
+    Refresh rate of the window's display: the cached calibration if it passes a quick validation, otherwise a new
+    measurement, which is saved for the next session.
+    Returns the refresh rate in Hz and the calibration record (with 'validated' True if the cached value was used).
+    """
+    calibrations = load_calibrations(path)
+    key = calibration_key(win)
+    calibration = calibrations.get(key)
+    if calibration is not None and validate_refresh(win, calibration['refresh_rate'], n_validate):
+        return calibration['refresh_rate'], dict(calibration, key=key, validated=True)
+
+    calibration = measure_refresh(win, n_measure)
+    calibrations[key] = calibration
+    save_calibrations(calibrations, path)
+    return calibration['refresh_rate'], dict(calibration, key=key, validated=False)
@@ -0,0 +1,62 @@
+"""
+regenerate the dot frames of any logged trial of main.py
+
+uses the session seed, frame rate and dot parameters in the <data file>_session.json written next to the data file,
+and the trial's direction and coherence from the data file
+
+usage: python replay_trial.py data/<participant>_<session>_<date>.trials <trial_count> [output.npz]
+(.csv data files of older runs work the same way)
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import csv
+import json
+import os
+import sys
+import numpy as np
+
+from rdk_engine import DotMotionEngine
+from rng_streams import trial_rng
+from trial_table import read_dataframe
+
+
+###################################
+# FUNCTIONS
+###################################
+def load_session(data_path):
+    """
+    session description (seed, frame rate, dot parameters, task variables) and the trial rows of a data file
+    """
+    with open(os.path.splitext(data_path)[0] + '_session.json') as f:
+        session = json.load(f)
+    if data_path.endswith('.trials'):
+        return session, read_dataframe(data_path).to_dict('records')
+    with open(data_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    return session, rows
+
+
+def replay_trial(data_path, trial_count):
+    """
+    regenerate the frames of one trial (trial_count as logged, counting from 1):
+    positions (n_frames, n_dots, 2) and opacities (n_frames, n_dots), bit-identical to the live run
+    """
+    session, rows = load_session(data_path)
+    row = next((row for row in rows if int(row['trial_count']) == trial_count), None)
+    if row is None:
+        raise ValueError(f'trial {trial_count} is not in {data_path}')
+    trial_index = trial_count - 1
+    engine = DotMotionEngine(session['frame_rate'], float(row['direction']), float(row['coherence']),
+                             session['dot_parameters'], trial_rng(session['session_seed'], trial_index, 'stimulus'))
+    return engine.frames()
+
+
+if __name__ == '__main__':
+    data_path, trial_count = sys.argv[1], int(sys.argv[2])
+    positions, opacities = replay_trial(data_path, trial_count)
+    print(f'trial {trial_count}: {positions.shape[0]} frames of {positions.shape[1]} dots')
+    if len(sys.argv) > 3:
+        np.savez(sys.argv[3], positions=positions, opacities=opacities)
+        print(f'saved to {sys.argv[3]}')
@@ -0,0 +1,60 @@
+"""
+key responses timed from the onset of the stimulus that asks for them
+
+hf.check_key_press polled event.getKeys every 10 ms (so response times were quantised to the poll interval), cleared
+the event buffer between polls (so a press could be lost) and returned a global timestamp. ResponseKeyboard reads
+psychopy.hardware.keyboard instead: with the psychtoolbox backend every key event is timestamped when it happens,
+whenever it is read, and the keyboard's clock is reset by the flip that shows the stimulus, so the response time is
+the time since its onset.
+
+usage:
+    response_keyboard.arm()  # before the flip that shows the reference
+    (draw the reference and flip)
+    response, response_time = response_keyboard.wait_for_response(gv['response_keys'])
+
+under run_headless.py the mock keyboard gives every scripted or simulated press its exact press time.
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+from psychopy import core
+from psychopy.hardware import keyboard
+
+
+###################################
+# CLASSES
+###################################
+class ResponseKeyboard:
+    """
+    Onset-referenced key responses.
+
+    Parameters:
+    - win: the PsychoPy window the stimuli are flipped on
+    - quit_keys: keys that close the window and quit while waiting for a response
+    - device: keyboard to read (default: a psychopy.hardware.keyboard.Keyboard), anything with clock, getKeys,
+      waitKeys and clearEvents
+    """
+
+    def __init__(self, win, quit_keys=('q',), device=None):
+        self.win = win
+        self.quit_keys = list(quit_keys)
+        self.device = device if device is not None else keyboard.Keyboard()
+
+    def arm(self):
+        """
+        reset the response clock and drop earlier presses on the next flip, call right before flipping the stimulus
+        """
+        self.win.callOnFlip(self.device.clock.reset)
+        self.win.callOnFlip(self.device.clearEvents)
+
+    def wait_for_response(self, key_list):
+        """
+        wait for the first press of a key in key_list since the armed flip, return the key and its time (s) from the
+        flip. Quit keys close the window and quit.
+        """
+        key = self.device.waitKeys(keyList=list(key_list) + self.quit_keys, waitRelease=False)[0]
+        if key.name in self.quit_keys:
+            self.win.close()
+            core.quit()
+        return key.name, key.rt
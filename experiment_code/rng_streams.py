@@ -0,0 +1,37 @@
+"""
+deterministic random number streams
+
+every (trial, subsystem) pair gets its own numpy Generator derived from the session seed only, so trials can be
+generated in any order or in parallel and still be bit-identical to a live run
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import numpy as np
+
+
+# spawn key of each subsystem that draws random numbers during a trial
+SUBSYSTEMS = dict(
+    conditions=0,  # direction, coherence, distance, reference side, ITI, confidence trial
+    stimulus=1,  # dot positions, signal dot selection, noise dot motion
+    confidence=2,  # initial slider position
+)
+
+
+###################################
+# FUNCTIONS
+###################################
+def new_session_seed():
+    """
+    fresh random session seed (a large int, log it to be able to replay the session)
+    """
+    return np.random.SeedSequence().entropy
+
+
+def trial_rng(session_seed, trial_index, subsystem='stimulus'):
+    """
+    Generator of one subsystem in one trial (trial_index counts from 0)
+    """
+    seed_sequence = np.random.SeedSequence(session_seed, spawn_key=(trial_index, SUBSYSTEMS[subsystem]))
+    return np.random.default_rng(seed_sequence)
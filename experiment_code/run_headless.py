@@ -0,0 +1,81 @@
+"""
+run an experiment script end-to-end without a display, on the mock psychopy backend
+
+usage: python run_headless.py [main.py|training.py|staircase.py] [--refresh-rate 60] [--keys o:0.6,space:1.2,...]
+                              [--seed 1] [--output-dir DIR] [--report report.json] [script arguments ...]
+
+data files are written to --output-dir (a new temporary directory by default), and a throughput/latency summary of
+the run is printed (and saved as JSON with --report)
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import argparse
+import json
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+import mock_psychopy
+
+
+###################################
+# FUNCTIONS
+###################################
+def parse_keys(keys):
+    """
+    'o:0.6,space:1.2' -> [('o', 0.6), ('space', 1.2)]
+    """
+    script = []
+    for entry in filter(None, keys.split(',')):
+        key, _, delay = entry.partition(':')
+        script.append((key, float(delay or 0.5)))
+    return script
+
+
+def run_headless(script_path, refresh_rate=60.0, script=(), seed=None, output_dir=None, argv=()):
+    """
+    run script_path on the mock backend and return the run summary
+    """
+    script_path = os.path.abspath(script_path)
+    output_dir = output_dir or tempfile.mkdtemp(prefix='headless_')
+    backend = mock_psychopy.install(refresh_rate, script, mock_psychopy.RandomParticipant(seed=seed))
+
+    sys.path.insert(0, os.path.dirname(script_path))
+    sys.argv = [script_path] + list(argv)
+    cwd = os.getcwd()
+    os.makedirs(output_dir, exist_ok=True)
+    os.chdir(output_dir)
+    start = time.perf_counter()
+    try:
+        runpy.run_path(script_path, run_name='__main__')
+    except SystemExit:
+        pass  # core.quit() at the end of the scripts
+    finally:
+        os.chdir(cwd)
+
+    summary = backend.summary()
+    summary.update(script=os.path.basename(script_path), output_dir=output_dir,
+                   wall_time=time.perf_counter() - start)
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='run an experiment script on the headless mock backend')
+    parser.add_argument('script', nargs='?', default='main.py')
+    parser.add_argument('--refresh-rate', type=float, default=60.0)
+    parser.add_argument('--keys', default='', help='scripted key presses as key:delay,... before random responses')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random participant')
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--report', default=None, help='save the summary as JSON')
+    args, script_argv = parser.parse_known_args()
+
+    summary = run_headless(args.script, args.refresh_rate, parse_keys(args.keys), args.seed, args.output_dir,
+                           script_argv)
+    print(json.dumps(summary, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,113 @@
+"""
+frame-locked scheduler for the trial phases of main.py
+
+every timed phase (ITI, dot motion, reference display, feedback, clear screen) is converted into an exact number of
+frames when the trial is planned and shown by the same flip-counting loop, so phase durations are whole numbers of
+refresh periods instead of core.wait() calls. The planned and achieved frames of every phase are logged.
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import numpy as np
+
+import helper_functions as hf
+from frame_timing import frames_for_duration
+from profiling import NULL_PROFILER
+
+
+###################################
+# CLASSES
+###################################
+class Phase:
+    """
+    One timed phase of a trial.
+
+    Parameters:
+    - name: name in the phase log (e.g. 'iti', 'motion')
+    - n_frames: number of flips the phase lasts
+    - stimuli: stimuli drawn on every frame (nested lists are flattened), compiled into a hf.Scene named after the phase
+    - on_frame: optional function called with the frame index before the stimuli are drawn (e.g. to set dot positions)
+    """
+
+    def __init__(self, name, n_frames, stimuli=(), on_frame=None):
+        self.name = name
+        self.n_frames = n_frames
+        self.scene = hf.Scene(stimuli, name)
+        self.on_frame = on_frame
+
+
+class FrameScheduler:
+    """
+    Runs phases with one flip per frame and logs, per phase, the planned frames and the frames it actually took
+    (refresh periods from its first to its last flip, so dropped frames show up as achieved > planned).
+    Pressing q during any phase closes the window and quits (hf.check_quit after every flip).
+    """
+
+    def __init__(self, win, frame_rate, profiler=NULL_PROFILER, quit_keys=('q',)):
+        self.win = win
+        self.frame_rate = frame_rate
+        self.frame_duration = 1.0 / frame_rate
+        self.profiler = profiler
+        self.quit_keys = list(quit_keys)
+        self.trial = None  # trial number written to the phase log
+        self.log = []  # dict(trial, phase, planned_frames, achieved_frames, onset, duration) per phase
+
+    def frames(self, duration):
+        """
+        number of frames of a duration in seconds at the scheduler's frame rate
+        """
+        return frames_for_duration(duration, self.frame_rate)
+
+    def phase(self, name, duration, stimuli=(), on_frame=None):
+        """
+        a Phase lasting duration seconds, rounded to whole frames
+        """
+        return Phase(name, self.frames(duration), stimuli, on_frame)
+
+    def run(self, phase):
+        """
+        show a phase for its number of frames and return the flip timestamps
+        """
+        profiler = self.profiler
+        flip_name = f'{phase.name}/flip'
+        flip_times = np.empty(phase.n_frames)
+        for frame in range(phase.n_frames):
+            if phase.on_frame is not None:
+                phase.on_frame(frame)
+            if profiler.enabled:
+                t = phase.scene.draw_profiled(profiler)  # one '<phase>/draw_<stimulus class>' lap per stimulus
+            else:
+                phase.scene.draw()
+                t = 0
+            flip_times[frame] = self.win.flip()
+            profiler.lap(flip_name, t)
+            hf.check_quit(self.win, self.quit_keys)
+        self.log_phase(phase.name, phase.n_frames, flip_times)
+        return flip_times
+
+    def log_phase(self, name, planned_frames, flip_times):
+        achieved_frames = int(round((flip_times[-1] - flip_times[0]) / self.frame_duration)) + 1
+        self.log.append(dict(trial=self.trial, phase=name, planned_frames=planned_frames,
+                             achieved_frames=achieved_frames, onset=float(flip_times[0]),
+                             duration=float(flip_times[-1] - flip_times[0] + self.frame_duration)))
+
+    def summary(self):
+        """
+        per phase name: number of phases, and how many of them took more frames than planned
+        """
+        summary = {}
+        for row in self.log:
+            phase = summary.setdefault(row['phase'], dict(n=0, late=0, extra_frames=0))
+            phase['n'] += 1
+            if row['achieved_frames'] > row['planned_frames']:
+                phase['late'] += 1
+                phase['extra_frames'] += row['achieved_frames'] - row['planned_frames']
+        return summary
+
+    def write_csv(self, path):
+        columns = ['trial', 'phase', 'planned_frames', 'achieved_frames', 'onset', 'duration']
+        with open(path, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for row in self.log:
+                f.write(','.join(str(row[column]) for column in columns) + '\n')
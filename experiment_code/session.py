@@ -0,0 +1,46 @@
+"""
+full session in one process: training -> staircase -> main task
+
+all three phases share one window, one set of preloaded instruction and dot field stimuli, and the participant info
+in memory. The staircase's calibrated low/high coherence and distance are passed straight to the main task.
+
+usage: python session.py
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+from psychopy import core
+
+import helper_functions as hf
+from main import run_main
+from staircase import run_staircase
+from training import dot_params, expName, run_training
+
+
+###################################
+# FUNCTIONS
+###################################
+def run_session(win, expInfo):
+    """
+    run training, staircase and main task in an open window, return the number of correct main task responses
+    """
+    text_stimuli = hf.create_text_stimuli(win)
+    preloaded_stimuli = dict(text_stimuli, **hf.create_dot_field_stimuli(win, dot_params))
+
+    info = run_training(win, expInfo, preloaded_stimuli)
+    calibration = run_staircase(win, info, preloaded_stimuli)
+    print('Staircase calibration:', calibration)
+    return run_main(win, expInfo, calibration, text_stimuli)
+
+
+if __name__ == '__main__':
+    print('Reminder: Press Q to quit.')
+    expInfo = hf.get_participant_info(expName)
+    win = hf.create_window()
+    run_session(win, expInfo)
+    hf.draw_stats.print_report()  # draw calls and drawing time per frame of every scene
+
+    # Close window
+    win.close()
+    core.quit()
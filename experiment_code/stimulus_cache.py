@@ -0,0 +1,145 @@
+"""
+full-session dot stimulus precomputation with a memory-mapped on-disk cache
+
+every trial's dot frames (positions + opacities of the set shown on each frame) are generated before the session
+and stored as .npy files, so playback only slices memory-mapped arrays
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+from rdk_engine import ENGINE_VERSION, DotMotionEngine
+from rng_streams import trial_rng
+
+
+###################################
+# FUNCTIONS
+###################################
+def cache_key(frame_rate, parameters, trials, seed):
+    """
+    hash of everything that determines the generated frames
+    """
+    description = dict(
+        frame_rate=round(float(frame_rate), 3),
+        parameters=parameters,
+        trials=[[float(direction), float(coherence)] for direction, coherence in trials],
+        seed=seed,
+        engine=ENGINE_VERSION,
+    )
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def generate_session_frames(directory, frame_rate, parameters, trials, seed):
+    """
+    generate the dot frames of every trial straight into memory-mapped .npy files in directory
+    (trials: list of (direction, coherence))
+    """
+    n_trials = len(trials)
+    engine = DotMotionEngine(frame_rate, 0, 0, parameters, trial_rng(seed, 0))
+    n_frames = engine.n_frames_for(parameters.get('duration', 5))
+    positions = np.lib.format.open_memmap(os.path.join(directory, 'positions.npy'), mode='w+', dtype=engine.dtype,
+                                          shape=(n_trials, n_frames, engine.n_dots, 2))
+    opacities = np.lib.format.open_memmap(os.path.join(directory, 'opacities.npy'), mode='w+', dtype=engine.dtype,
+                                          shape=(n_trials, n_frames, engine.n_dots))
+    for trial_index, (direction, coherence) in enumerate(trials):
+        engine = DotMotionEngine(frame_rate, direction, coherence, parameters, trial_rng(seed, trial_index))
+        for frame in range(n_frames):
+            positions[trial_index, frame], opacities[trial_index, frame] = engine.step()
+    positions.flush()
+    opacities.flush()
+    del positions, opacities
+
+
+###################################
+# CLASSES
+###################################
+class SessionStimuli:
+    """
+    memory-mapped dot frames of a whole session, trial(i) returns (positions, opacities) of trial i
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.positions = np.load(os.path.join(directory, 'positions.npy'), mmap_mode='r')
+        self.opacities = np.load(os.path.join(directory, 'opacities.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.positions)
+
+    def trial(self, trial_index):
+        return self.positions[trial_index], self.opacities[trial_index]
+
+
+class StimulusCache:
+    """
+    on-disk cache of precomputed sessions, keyed by frame rate, dot parameters, trial list and seed.
+    Entries are reused across runs with identical inputs; the least recently used entries are evicted once the cache
+    grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir='stimulus_cache', max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.exists(cache_dir):
+            os.mkdir(cache_dir)
+
+    def load_or_generate(self, frame_rate, parameters, trials, seed):
+        """
+        return the SessionStimuli for these inputs, generating them first if they are not cached
+        """
+        key = cache_key(frame_rate, parameters, trials, seed)
+        directory = os.path.join(self.cache_dir, key)
+        meta_path = os.path.join(directory, 'meta.json')
+
+        if os.path.exists(meta_path):
+            os.utime(meta_path)  # mark as recently used
+            print(f'Stimulus cache hit: {key}')
+        else:
+            start = time.perf_counter()
+            tmp_directory = directory + '.tmp'
+            if os.path.exists(tmp_directory):
+                shutil.rmtree(tmp_directory)  # left over from an interrupted run
+            os.mkdir(tmp_directory)
+            generate_session_frames(tmp_directory, frame_rate, parameters, trials, seed)
+            with open(os.path.join(tmp_directory, 'meta.json'), 'w') as f:  # written last, marks a complete entry
+                json.dump(dict(frame_rate=frame_rate, parameters=parameters, trials=trials, seed=seed), f)
+            os.replace(tmp_directory, directory)
+            print(f'Stimulus cache miss: generated {len(trials)} trials in {time.perf_counter() - start:.1f} s')
+            self.evict(keep=key)
+
+        return SessionStimuli(directory)
+
+    def entries(self):
+        """
+        complete cache entries as (last used, size in bytes, directory), least recently used first
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            directory = os.path.join(self.cache_dir, key)
+            meta_path = os.path.join(directory, 'meta.json')
+            if not os.path.exists(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            entries.append((os.path.getmtime(meta_path), size, directory))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """
+        delete least recently used entries until the cache fits in max_bytes (never deletes the entry keep)
+        """
+        entries = self.entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, directory in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if os.path.basename(directory) == keep:
+                continue
+            shutil.rmtree(directory)
+            total_bytes -= size
@@ -0,0 +1,122 @@
+"""
+pipelined next-trial dot stimulus prefetch
+
+a worker thread generates trial N+1's dot frames while trial N is in its response, confidence and clear-screen phases.
+Frames are written into two preallocated frame buffers that the render loop plays back without copying.
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import queue
+import threading
+import time
+import numpy as np
+
+from rdk_engine import DotMotionEngine
+from rng_streams import trial_rng
+
+
+###################################
+# CLASSES
+###################################
+class StimulusPrefetcher:
+    """
+    Producer/consumer prefetch of dot frames. request() queues a trial for the worker thread, get() hands the
+    finished frames over (waiting only if the worker is not done yet). Trial i uses buffer slot i % 2, so trial N+1
+    can be generated while trial N's frames are still in use; do not request N+2 before N has been played.
+
+    Parameters:
+    - frame_rate: refresh rate of the display in Hz
+    - parameters: dot parameters as for create_dot_motion_stimulus_n_sets
+    - seed: session stimulus seed, trial i uses trial_rng(seed, i) like the live and precomputed paths
+    """
+
+    def __init__(self, frame_rate, parameters, seed):
+        self.frame_rate = frame_rate
+        self.parameters = parameters
+        self.seed = seed
+        engine = DotMotionEngine(frame_rate, 0, 0, parameters)
+        self.n_frames = engine.n_frames_for(parameters.get('duration', 5))
+        self.positions = np.empty((2, self.n_frames, engine.n_dots, 2), dtype=engine.dtype)
+        self.opacities = np.empty((2, self.n_frames, engine.n_dots), dtype=engine.dtype)
+        self.slot_trial = [None, None]  # trial index requested into each slot
+        self.slot_ready = [threading.Event(), threading.Event()]
+
+        # instrumentation: one record per get() with how the frames were obtained and how long the render thread waited
+        self.records = []
+
+        self.jobs = queue.Queue()
+        self.worker = threading.Thread(target=self.run, name='stimulus-prefetch', daemon=True)
+        self.worker.start()
+
+    def generate(self, slot, trial_index, direction, coherence):
+        """
+        generate a trial's frames into a buffer slot
+        """
+        engine = DotMotionEngine(self.frame_rate, direction, coherence, self.parameters, trial_rng(self.seed, trial_index))
+        positions, opacities = self.positions[slot], self.opacities[slot]
+        for frame in range(self.n_frames):
+            positions[frame], opacities[frame] = engine.step()
+
+    def run(self):
+        """
+        worker thread loop
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            slot = job[0]
+            self.generate(*job)
+            self.slot_ready[slot].set()
+
+    def request(self, trial_index, direction, coherence):
+        """
+        start generating a trial's frames in the background
+        """
+        slot = trial_index % 2
+        self.slot_ready[slot].clear()
+        self.slot_trial[slot] = trial_index
+        self.jobs.put((slot, trial_index, direction, coherence))
+
+    def get(self, trial_index, direction, coherence):
+        """
+        return (positions, opacities) of a trial, views into the buffer slot that stay valid until trial_index + 2 is
+        requested; frames that were never requested are generated on the calling thread
+        """
+        slot = trial_index % 2
+        start = time.perf_counter()
+        if self.slot_trial[slot] != trial_index:
+            status = 'not_requested'
+            self.slot_trial[slot] = trial_index
+            self.generate(slot, trial_index, direction, coherence)
+        elif self.slot_ready[slot].is_set():
+            status = 'ready'
+        else:
+            status = 'waited'
+            self.slot_ready[slot].wait()
+        self.records.append(dict(trial_index=trial_index, status=status, wait_ms=(time.perf_counter() - start) * 1000))
+        return self.positions[slot], self.opacities[slot]
+
+    def summary(self):
+        """
+        how often the prefetched frames were ready in time, and the waits of the render thread
+        """
+        wait_ms = np.array([record['wait_ms'] for record in self.records])
+        statuses = [record['status'] for record in self.records]
+        return dict(
+            n_trials=len(self.records),
+            ready_in_time=statuses.count('ready'),
+            waited=statuses.count('waited'),
+            not_requested=statuses.count('not_requested'),
+            mean_wait_ms=float(wait_ms.mean()) if len(wait_ms) else 0.0,
+            max_wait_ms=float(wait_ms.max()) if len(wait_ms) else 0.0,
+        )
+
+    def close(self):
+        """
+        stop the worker thread
+        """
+        self.jobs.put(None)
+        self.worker.join()
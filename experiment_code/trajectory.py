@@ -0,0 +1,153 @@
+"""
+per-frame dot trajectories of a session, for reverse-correlation and motion-energy analyses
+
+TrajectoryRecorder keeps the positions and visibility of the dots shown on every frame of a trial (one array copy per
+frame on the render thread) and hands the trial to a trial_writer.TrialWriter when its dot display has ended. The
+writer thread quantises and appends it to the session's .traj file:
+
+    b'RDKTRAJ1' | header size (uint64) | header JSON (see trial_table.pack_header) | frame records
+
+one fixed-size record per frame: trial (int32), frame (int32), dot positions as int16 relative to the aperture
+(x / aperture_radius * 32767, so about 0.1 arcmin steps for an 8 deg aperture) and one visibility bit per dot
+(opacity > 0, packed with np.packbits). Records are only appended, so a file cut off by a crash loses at most the
+trials still queued, and Trajectories memory-maps it and indexes the records by trial and frame.
+
+usage:
+    trajectories = Trajectories(filename + '.traj')
+    positions, visible = trajectories.trial(12)  # (n_frames, n_dots, 2) in deg, (n_frames, n_dots) bool
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import os
+import numpy as np
+
+from trial_table import pack_header, read_header
+from trial_writer import TrialWriter
+
+MAGIC = b'RDKTRAJ1'
+VERSION = 1
+INT16_MAX = 32767
+
+
+###################################
+# CLASSES
+###################################
+class TrajectoryEncoder:
+    """
+    Encodes (trial, positions, visible) rows for trial_writer.TrialWriter as quantised frame records.
+    """
+
+    def __init__(self, n_dots, aperture_radius):
+        self.n_dots = n_dots
+        self.aperture_radius = aperture_radius
+        self.scale = INT16_MAX / aperture_radius
+        self.dtype = record_dtype(n_dots)
+
+    def header(self, first_row=None):
+        return pack_header(dict(version=VERSION, n_dots=self.n_dots, aperture_radius=self.aperture_radius,
+                                scale=self.scale), MAGIC)
+
+    def encode(self, rows):
+        blocks = []
+        for trial, positions, visible in rows:
+            records = np.empty(len(positions), self.dtype)
+            records['trial'] = trial
+            records['frame'] = np.arange(len(positions))
+            records['xy'] = np.clip(np.rint(positions * self.scale), -INT16_MAX, INT16_MAX)
+            records['visible'] = np.packbits(visible, axis=-1)
+            blocks.append(records.tobytes())
+        return b''.join(blocks)
+
+
+class TrajectoryRecorder:
+    """
+    Records the dot frames of each trial and writes them to a .traj file in the background.
+
+    Parameters:
+    - path: the session's .traj file
+    - n_dots: dots per frame
+    - aperture_radius: radius of the dot aperture (deg), the quantisation range
+    - max_frames: most dot frames of one trial
+    """
+
+    def __init__(self, path, n_dots, aperture_radius, max_frames):
+        self.positions = np.empty((max_frames, n_dots, 2))
+        self.visible = np.empty((max_frames, n_dots), dtype=bool)
+        self.n_frames = 0
+        self.writer = TrialWriter(path, ['trial', 'positions', 'visible'], TrajectoryEncoder(n_dots, aperture_radius))
+
+    def record(self, frame, dot_positions, dot_opacities):
+        """
+        keep one frame's dot positions and visibility (call with the arrays passed to the dot stimulus)
+        """
+        self.positions[frame] = dot_positions
+        np.greater(dot_opacities, 0, out=self.visible[frame])
+        self.n_frames = max(self.n_frames, frame + 1)
+
+    def write_trial(self, trial):
+        """
+        queue the frames recorded since the last call as trial number trial
+        """
+        self.writer.write(dict(trial=trial, positions=self.positions[:self.n_frames].copy(),
+                               visible=self.visible[:self.n_frames].copy()))
+        self.n_frames = 0
+
+    def close(self):
+        self.writer.close()
+
+
+class Trajectories:
+    """
+    memory-mapped dot trajectories of a .traj file; trial(t) returns the dequantised frames of trial number t
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.header = read_header(f, MAGIC, VERSION)
+            offset = f.tell()
+        self.n_dots = self.header['n_dots']
+        self.scale = self.header['scale']
+        dtype = record_dtype(self.n_dots)
+        n_records = (os.path.getsize(path) - offset) // dtype.itemsize  # complete frames only
+        if n_records:
+            self.records = np.memmap(path, dtype, 'r', offset, (n_records,))
+        else:
+            self.records = np.empty(0, dtype)
+
+        # trials are appended one after the other, so each trial is one contiguous run of records
+        trials = np.asarray(self.records['trial'])
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(trials)) + 1])
+        ends = np.append(starts[1:], len(trials))
+        self.index = {int(trials[start]): slice(start, end) for start, end in zip(starts, ends) if end > start}
+
+    @property
+    def trials(self):
+        return list(self.index)
+
+    def frames(self, trial):
+        """
+        raw records (trial, frame, xy int16, packed visibility) of a trial, a view into the memory map
+        """
+        return self.records[self.index[trial]]
+
+    def trial(self, trial):
+        """
+        positions (n_frames, n_dots, 2) in deg and visibility (n_frames, n_dots) of a trial
+        """
+        records = self.frames(trial)
+        positions = records['xy'] / self.scale
+        visible = np.unpackbits(records['visible'], axis=-1, count=self.n_dots).astype(bool)
+        return positions, visible
+
+
+###################################
+# FUNCTIONS
+###################################
+def record_dtype(n_dots):
+    """
+    numpy dtype of one frame record with n_dots dots
+    """
+    return np.dtype([('trial', '<i4'), ('frame', '<i4'), ('xy', '<i2', (n_dots, 2)),
+                     ('visible', 'u1', ((n_dots + 7) // 8,))])
@@ -0,0 +1,220 @@
+"""
+compact trial data: a one-time session header and fixed-dtype binary trial rows
+
+the CSV files repeated the session-constant columns (expName, participant, date, ...) in every row and wrote None as
+text. A .trials file stores them once, in a JSON header, followed by one fixed-size little-endian record per trial:
+
+    b'RDKTRIAL' | header size (uint64) | header JSON, space-padded to a multiple of 8 bytes | trial records
+
+the header holds the format version, all columns in CSV order, the session values and the numpy dtype of the
+records. Missing values (None) are NaN in float columns, -1 in integer columns and b'' in text columns. A float
+column can be given ints (e.g. distance: 20 in one staircase trial, 10.0 in the next), so each record also has an
+int_values bit mask of the float columns (header 'int_columns') whose value was an int. The records
+are appended by trial_writer.TrialWriter (see TrialTableEncoder); a record cut off by a crash is ignored by the reader.
+Text longer than its field and session values that change after the first trial raise a ValueError (re-raised on the
+experiment thread by the writer) instead of being cut off or dropped.
+
+usage:
+    header, trials = read_trial_table(path)  # dict, numpy structured array
+    df = read_dataframe(path)  # pandas, session columns included
+    export_csv(path)  # the CSV layout written before, value for value (also: python trial_table.py file.trials ...)
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import csv
+import json
+import numbers
+import os
+import struct
+import sys
+import numpy as np
+
+MAGIC = b'RDKTRIAL'
+VERSION = 2
+MISSING_INT = -1
+INT_VALUES = 'int_values'  # record field: bit i set if the value of int_columns[i] was an int
+
+# columns that are the same in every row of a session, stored once in the header
+SESSION_COLUMNS = ['eeg', 'expName', 'curec_ID', 'session_nr', 'date', 'start_time', 'end_time', 'participant',
+                   'age', 'gender', 'session_seed']
+
+# record types of the per-trial columns of main.py, training.py and staircase.py (other columns are stored as text)
+TRIAL_DTYPES = dict(
+    trial_count='<i4',
+    coherence='<f8',
+    distance='<f8',
+    direction='<f8',
+    reference_direction='S3',
+    response='S3',
+    response_time='<f8',
+    confidence_rating='<i2',
+    confidence_response_time='<f8',
+    dropped_frames='<i4',
+    max_frame_interval='<f8',
+    motion_duration='<f8',
+    block_type='S10',
+    low_coherence='<f8',
+    high_coherence='<f8',
+    low_distance='<f8',
+    high_distance='<f8',
+)
+TEXT_DTYPE = 'S64'
+
+
+###################################
+# CLASSES
+###################################
+class TrialTableEncoder:
+    """
+    Encodes trial rows (lists of values in column order) for trial_writer.TrialWriter: the header from the first row
+    and one fixed-dtype record per row. Every row must have the session values of the first row.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.trial_columns = [column for column in self.columns if column not in SESSION_COLUMNS]
+        self.int_columns = [column for column in self.trial_columns
+                            if np.dtype(TRIAL_DTYPES.get(column, TEXT_DTYPE)).kind == 'f']
+        if len(self.int_columns) > 64:
+            raise ValueError(f'{len(self.int_columns)} float columns, the int_values mask holds 64')
+        self.dtype = np.dtype([(column, TRIAL_DTYPES.get(column, TEXT_DTYPE)) for column in self.trial_columns] +
+                              [(INT_VALUES, '<u8')])
+        self.indices = [self.columns.index(column) for column in self.trial_columns]
+        self.session_indices = {column: i for i, column in enumerate(self.columns) if column in SESSION_COLUMNS}
+        self.session = None
+
+    def header(self, first_row=None):
+        self.session = {column: (None if first_row is None else first_row[i])
+                        for column, i in self.session_indices.items()}
+        return pack_header(dict(version=VERSION, columns=self.columns, session=self.session, dtype=self.dtype.descr,
+                                int_columns=self.int_columns))
+
+    def encode(self, rows):
+        for row in rows:
+            for column, i in self.session_indices.items():
+                if row[i] != self.session[column]:
+                    raise ValueError(f'session column {column} changed from {self.session[column]!r} to {row[i]!r}, '
+                                     f'the header only stores the value of the first trial')
+        records = np.empty(len(rows), self.dtype)
+        int_values = [0] * len(rows)
+        for column, i in zip(self.trial_columns, self.indices):
+            kind = self.dtype[column].kind
+            if kind == 'f':
+                records[column] = [np.nan if row[i] is None else float(row[i]) for row in rows]
+                bit = 1 << self.int_columns.index(column)
+                for r, row in enumerate(rows):
+                    if isinstance(row[i], numbers.Integral) and not isinstance(row[i], bool):
+                        int_values[r] |= bit
+            elif kind == 'i':
+                records[column] = [MISSING_INT if row[i] is None else int(row[i]) for row in rows]
+            else:
+                values = [b'' if row[i] is None else str(row[i]).encode('utf-8') for row in rows]
+                size = self.dtype[column].itemsize
+                for value in values:
+                    if len(value) > size:
+                        raise ValueError(f'{column} value {value.decode("utf-8")!r} does not fit its {size} byte field')
+                records[column] = values
+        records[INT_VALUES] = int_values
+        return records.tobytes()
+
+
+###################################
+# FUNCTIONS
+###################################
+def pack_header(header, magic=MAGIC):
+    """
+    magic | header size (uint64) | header JSON padded to a multiple of 8 bytes, so the records that follow are aligned
+    """
+    text = json.dumps(header, default=str).encode('utf-8')
+    text += b' ' * (-len(text) % 8)
+    return magic + struct.pack('<Q', len(text)) + text
+
+
+def read_header(f, magic=MAGIC, version=VERSION):
+    """
+    header dict of an open file written with pack_header, leaves the file at the first record
+    """
+    if f.read(len(magic)) != magic:
+        raise ValueError(f'{f.name} is not a {magic.decode()} file')
+    size, = struct.unpack('<Q', f.read(8))
+    header = json.loads(f.read(size).decode('utf-8'))
+    if header['version'] > version:
+        raise ValueError(f"{f.name} has {magic.decode()} version {header['version']}, this reader supports {version}")
+    return header
+
+
+def read_trial_table(path):
+    """
+    header dict and trial records (numpy structured array) of a .trials file
+    """
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        dtype = np.dtype([tuple(field) for field in header['dtype']])
+        n_trials = (os.path.getsize(path) - f.tell()) // dtype.itemsize  # complete records only
+        trials = np.fromfile(f, dtype, count=n_trials)
+    return header, trials
+
+
+def read_dataframe(path, session_columns=True):
+    """
+    trials of a .trials file as a pandas DataFrame with the CSV columns (session columns repeated in every row unless
+    session_columns is False). Missing values are NaN / <NA> / None.
+    """
+    import pandas as pd
+
+    header, trials = read_trial_table(path)
+    names = [name for name in trials.dtype.names if name != INT_VALUES]
+    df = pd.DataFrame({column: trials[column] for column in names})
+    for column in names:
+        kind = trials.dtype[column].kind
+        if kind == 'i':
+            df[column] = df[column].astype('Int64').mask(df[column] == MISSING_INT)
+        elif kind == 'S':
+            df[column] = [value.decode('utf-8') if value else None for value in trials[column]]
+    if not session_columns:
+        return df
+    for column, value in header['session'].items():
+        df[column] = [value] * len(df)
+    return df[header['columns']]
+
+
+def format_value(value, kind, is_int=False):
+    """
+    CSV text of a record value: str() of the value as it was given (an int if is_int), 'None' where it is missing
+    """
+    if kind == 'f':
+        if np.isnan(value):
+            return 'None'
+        return str(int(value)) if is_int else str(float(value))
+    if kind == 'i':
+        return 'None' if value == MISSING_INT else str(int(value))
+    return value.decode('utf-8') if value else 'None'
+
+
+def export_csv(path, csv_path=None):
+    """
+    write a .trials file in the CSV layout of the experiment scripts (next to it by default), return the CSV path
+    """
+    if csv_path is None:
+        csv_path = os.path.splitext(path)[0] + '.csv'
+    header, trials = read_trial_table(path)
+    session = {column: str(value) for column, value in header['session'].items()}
+    kinds = {column: trials.dtype[column].kind for column in trials.dtype.names}
+    int_bits = {column: 1 << bit for bit, column in enumerate(header.get('int_columns', []))}  # none in version 1
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(header['columns'])
+        for trial in trials:
+            int_values = int(trial[INT_VALUES]) if int_bits else 0
+            writer.writerow([session[column] if column in session else
+                             format_value(trial[column], kinds[column], bool(int_values & int_bits.get(column, 0)))
+                             for column in header['columns']])
+    return csv_path
+
+
+if __name__ == '__main__':
+    # python trial_table.py data/*.trials -> one CSV per file
+    for path in sys.argv[1:]:
+        print(export_csv(path))
@@ -0,0 +1,120 @@
+"""
+trial data written by a background thread
+
+the experiment loops used to format, write and flush every trial row on the render thread between stimulus phases,
+without quoting and without ever closing the file when the participant quit with q. TrialWriter.write() only puts a
+snapshot of the trial's values on a queue; a writer thread encodes the rows (CSVEncoder, or the compact binary
+trial_table.TrialTableEncoder used by the experiment scripts), flushes every batch (so completed trials survive a
+crash of the experiment process) and fsyncs periodically (so they also survive a crash of the computer). Writers still
+open at exit, e.g. after hf.exit_q -> core.quit(), are drained and closed by an atexit handler.
+
+usage:
+    writer = TrialWriter(filename + '.trials', list(info.keys()), TrialTableEncoder(list(info.keys())))
+    writer.write(info)  # once per trial
+    writer.close()
+"""
+
+###################################
+# IMPORT PACKAGES
+###################################
+import atexit
+import csv
+import io
+import os
+import queue
+import threading
+import time
+
+
+###################################
+# CLASSES
+###################################
+class CSVEncoder:
+    """
+    CSV rows with the column names as header, values as str(value) (None -> 'None'), quoted where needed
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+
+    def header(self, first_row=None):
+        return self.encode([self.columns])
+
+    def encode(self, rows):
+        text = io.StringIO()
+        csv.writer(text, lineterminator='\n').writerows([[str(value) for value in row] for row in rows])
+        return text.getvalue().encode('utf-8')
+
+
+class TrialWriter:
+    """
+    Writes trial records to a file from a background thread.
+
+    Parameters:
+    - path: output file
+    - columns: names of the logged variables, in file order
+    - encoder: turns the first row into the file header and rows into bytes (default: CSVEncoder(columns))
+    - fsync_interval: seconds between fsyncs of the file (every batch is flushed to the OS immediately)
+    """
+
+    _close = object()  # queued by close() after the last record
+
+    def __init__(self, path, columns, encoder=None, fsync_interval=2.0):
+        self.path = path
+        self.columns = list(columns)
+        self.encoder = encoder if encoder is not None else CSVEncoder(columns)
+        self.fsync_interval = fsync_interval
+        self.n_written = 0
+        self.error = None
+        self.closed = False
+        self.records = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='TrialWriter', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        """
+        queue one trial: the values of the columns in record (e.g. the info dict) at the time of the call
+        """
+        if self.error is not None:
+            raise self.error
+        if self.closed:
+            raise ValueError(f'TrialWriter for {self.path} is closed')
+        self.records.put([record[column] for column in self.columns])
+
+    def close(self):
+        """
+        write all queued trials, fsync and close the file (waits for the writer thread, safe to call twice)
+        """
+        if not self.closed:
+            self.closed = True
+            self.records.put(self._close)
+            self.thread.join()
+            atexit.unregister(self.close)
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        try:
+            with open(self.path, 'wb') as f:
+                header_written = False
+                last_sync = time.monotonic()
+                done = False
+                while not done:
+                    batch = [self.records.get()]  # wait for the next trial, then take whatever else is queued
+                    while not self.records.empty():
+                        batch.append(self.records.get())
+                    if batch[-1] is self._close:
+                        batch.pop()
+                        done = True
+                    if not header_written:  # session values of the header are taken from the first trial
+                        f.write(self.encoder.header(batch[0] if batch else None))
+                        header_written = True
+                    f.write(self.encoder.encode(batch))
+                    f.flush()
+                    self.n_written += len(batch)
+                    if done or time.monotonic() - last_sync >= self.fsync_interval:
+                        os.fsync(f.fileno())
+                        last_sync = time.monotonic()
+        except Exception as e:  # raised on the render thread by the next write() or close()
+            self.error = e